@@ -0,0 +1,164 @@
+################################################################################
+
+# A local stand-in for the Wayback Machine and its CDX API, for trying
+# newsroom-scrape --resolve without touching archive.org.
+#
+# Every page has one capture. Half of the URLs written to --urls have the
+# exact capture timestamp, and the rest are off by a few days (and fail
+# until resolved):
+#
+#   python benchmarks/cdx_server.py --pages 100 --urls urls.txt &
+#   newsroom-scrape --urls urls.txt --archive test.archive --sleep 0 \
+#       --resolve --cdx http://127.0.0.1:8790/cdx/search/cdx
+
+import asyncio, click, json
+
+from urllib.parse import parse_qsl
+
+################################################################################
+
+def _captures(pages):
+
+    return {
+        f"http://example.com/article/{i}": "201701%02d120000" % (i % 28 + 1)
+        for i in range(pages)
+    }
+
+
+def _response(status, body, kind = "text/html; charset=utf-8"):
+
+    body = body.encode("utf-8")
+
+    return (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: {kind}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    ).encode("ascii") + body
+
+
+def _handler(captures):
+
+    def cdx(query):
+
+        params = dict(parse_qsl(query))
+        timestamp = captures.get(params.get("url"))
+        rows = [["timestamp", "original"]]
+
+        if timestamp is not None:
+
+            rows.append([timestamp, params["url"]])
+
+        return _response("200 OK", json.dumps(rows), "application/json")
+
+    def page(path):
+
+        before, _, original = path.partition("id_/")
+        timestamp = before.rsplit("/", 1)[-1]
+
+        if captures.get(original) != timestamp:
+
+            return _response("404 Not Found", "")
+
+        return _response("200 OK", (
+            "<html><head><meta name=\"description\" content=\""
+            f"Summary of {original}\"></head><body><p>"
+            + "This is a sentence of article text. " * 20
+            + "</p></body></html>"))
+
+    async def handle(reader, writer):
+
+        try:
+
+            while True:
+
+                request = await reader.readuntil(b"\r\n\r\n")
+                target = request.split(b" ")[1].decode("utf-8")
+                path, _, query = target.partition("?")
+
+                if path == "/cdx/search/cdx":
+
+                    writer.write(cdx(query))
+
+                else:
+
+                    writer.write(page(path))
+
+                await writer.drain()
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+
+            pass
+
+        finally:
+
+            writer.close()
+
+    return handle
+
+################################################################################
+
+@click.command()
+
+@click.option(
+    "--port",
+    type = int,
+    default = 8790,
+    help = "Port to serve on. [default = 8790]",
+)
+
+@click.option(
+    "--pages",
+    type = int,
+    default = 100,
+    help = "Number of captured pages. [default = 100]",
+)
+
+@click.option(
+    "--urls",
+    type = click.Path(dir_okay = False, writable = True),
+    default = None,
+    help = "Write archive URLs to download to this file.",
+)
+
+################################################################################
+
+def main(port, pages, urls):
+
+    captures = _captures(pages)
+    prefix = f"http://127.0.0.1:{port}/web/"
+
+    if urls:
+
+        with open(urls, "w") as f:
+
+            for i, (original, timestamp) in enumerate(captures.items()):
+
+                # Ask for a day later than the capture for odd pages.
+
+                if i % 2:
+
+                    timestamp = timestamp[:6] + "%02d" % (int(timestamp[6:8]) + 1) \
+                        + timestamp[8:]
+
+                f.write(prefix + timestamp + "id_/" + original + "\n")
+
+    async def serve():
+
+        server = await asyncio.start_server(
+            _handler(captures), "127.0.0.1", port, backlog = 1024)
+
+        print("Serving", len(captures), "captures on port", port)
+
+        async with server:
+
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+
+    main()
+
+################################################################################
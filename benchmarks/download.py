@@ -0,0 +1,152 @@
+################################################################################
+
+# Compare the thread pool and asyncio download engines against a local
+# mock server that answers every request after a fixed latency.
+#
+#   python benchmarks/download.py --pages 2000 --latency 0.05 --workers 16,256
+
+import asyncio, click, multiprocessing, time
+
+from newsroom.build import Downloader
+
+################################################################################
+
+def _serve(port, latency, size, ready):
+
+    # A keep-alive HTTP/1.1 server on asyncio, so that hundreds of open
+    # connections do not make the server the bottleneck.
+
+    body = ("<html><body>" + "x" * size + "</body></html>").encode("utf-8")
+
+    response = (
+        "HTTP/1.1 200 OK\r\n"
+        "Content-Type: text/html; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    ).encode("ascii") + body
+
+    async def handle(reader, writer):
+
+        try:
+
+            while True:
+
+                await reader.readuntil(b"\r\n\r\n")
+                await asyncio.sleep(latency)
+
+                writer.write(response)
+                await writer.drain()
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+
+            pass
+
+        finally:
+
+            writer.close()
+
+    async def serve():
+
+        server = await asyncio.start_server(
+            handle, "127.0.0.1", port, backlog = 1024)
+
+        ready.set()
+
+        async with server:
+
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def _time_download(urls, **kwargs):
+
+    downloader = Downloader(sleep = 0, **kwargs)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    pages = sum(1 for page in downloader.download(urls) if page)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    return pages, wall, cpu
+
+################################################################################
+
+@click.command()
+
+@click.option(
+    "--pages",
+    type = int,
+    default = 2000,
+    help = "Number of pages to download. [default = 2000]",
+)
+
+@click.option(
+    "--latency",
+    type = float,
+    default = 0.05,
+    help = "Server response delay in seconds. [default = 0.05]",
+)
+
+@click.option(
+    "--size",
+    type = int,
+    default = 50000,
+    help = "Approximate bytes of HTML per page. [default = 50000]",
+)
+
+@click.option(
+    "--workers",
+    type = str,
+    default = "16,64,256",
+    help = "Worker counts to try. [default = 16,64,256]",
+)
+
+@click.option(
+    "--port",
+    type = int,
+    default = 8765,
+    help = "Port for the mock server. [default = 8765]",
+)
+
+################################################################################
+
+def main(pages, latency, size, workers, port):
+
+    # Serve from another process so its CPU time is not counted.
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target = _serve,
+        args = (port, latency, size, ready),
+        daemon = True)
+
+    server.start()
+    ready.wait()
+
+    urls = [f"http://127.0.0.1:{port}/{i}" for i in range(pages)]
+
+    try:
+
+        for count in map(int, workers.split(",")):
+            for engine in ["threads", "async"]:
+
+                done, wall, cpu = _time_download(
+                    urls, workers = count, engine = engine)
+
+                print(
+                    f"{engine:>8} x {count:<4}:",
+                    f"{done / wall:8.1f} pages/sec",
+                    f"{1000 * cpu / max(done, 1):8.2f} ms CPU/page",
+                    f"({done}/{pages} ok)",
+                )
+
+    finally:
+
+        server.terminate()
+
+
+if __name__ == "__main__":
+
+    main()
+
+################################################################################
@@ -0,0 +1,317 @@
+################################################################################
+
+# Check that Article's single-parse path gives exactly the same serialize()
+# output as the legacy path (separate parses, BeautifulSoup lookups), and
+# time both per page. Pages come from an archive, a directory of HTML files,
+# or (by default) a generated corpus of news-like pages with the awkward
+# parts of real ones: several description tags, canonical links, hidden
+# elements, entities, tables, and <div>s that readability turns into <p>s.
+#
+#   python benchmarks/extract_parse.py
+#   python benchmarks/extract_parse.py --archive dev.archive --limit 2000
+#   python benchmarks/extract_parse.py --html-dir saved_pages/
+#
+# With --skip-unsummarized, the single-parse path also skips pages without
+# a summary, which must be exactly the pages the legacy path gives no
+# summary for.
+
+import click, glob, os, random, time
+
+from newsroom import jsonl
+from newsroom.build import Article
+from newsroom.build.charset import page_html
+
+################################################################################
+
+_words = (
+    "the city council said on monday that it would vote on a new budget for "
+    "schools and roads after months of debate among residents officials and "
+    "local business owners who have argued over taxes &amp; spending"
+).split()
+
+
+def _sentence(rng, n = None):
+
+    n = n or rng.randint(4, 30)
+
+    return " ".join(rng.choice(_words) for _ in range(n)).capitalize() + "."
+
+
+def _paragraph(rng):
+
+    # Paragraph text with inline markup, entities and odd whitespace.
+
+    parts = []
+
+    for _ in range(rng.randint(1, 4)):
+
+        text = _sentence(rng)
+        kind = rng.random()
+
+        if kind < 0.15:
+
+            text = f"<a href=\"/x\">{text}</a>"
+
+        elif kind < 0.25:
+
+            text = f"<b>{text}</b> <i>{_sentence(rng, 3)}</i>"
+
+        elif kind < 0.3:
+
+            text = text.replace(" ", "&nbsp;", 2) + "<br>\n  "
+
+        parts.append(text)
+
+    return " ".join(parts)
+
+
+def _page(i, rng):
+
+    head = [f"<title>{_sentence(rng, 8)} - Daily News</title>"]
+    kinds = ["og:description", "twitter:description", "description",
+             "Description", "dc.description"]
+
+    for kind in rng.sample(kinds, rng.randint(0, 3)):
+
+        attr = "property" if kind.startswith("og") else "name"
+        head.append(f"<meta {attr}=\"{kind}\" content=\" {_sentence(rng)} \">")
+
+    if rng.random() < 0.1:
+
+        head.append("<meta name=\"description\">")
+
+    if rng.random() < 0.5:
+
+        href = rng.choice(["/story/%d" % i, "http://a.com/story/%d" % i,
+                           "http://b.com/story/%d" % i])
+        head.append(f"<link rel=\"canonical\" href=\"{href}\">")
+
+    body = ["<div id=\"nav\"><ul><li><a href=\"/\">Home</a></li>"
+            "<li><a href=\"/world\">World</a></li></ul></div>"]
+
+    article = [f"<h1>{_sentence(rng, 8)}</h1>"]
+
+    for _ in range(rng.randint(0, 12)):
+
+        kind = rng.random()
+
+        if kind < 0.6:
+
+            article.append(f"<p>{_paragraph(rng)}</p>")
+
+        elif kind < 0.7:
+
+            # Readability turns this <div> into a <p> with a heading in it.
+
+            article.append(f"<div><h3>{_sentence(rng, 5)}</h3>"
+                           f"{_paragraph(rng)}</div>")
+
+        elif kind < 0.8:
+
+            article.append(f"<div>{_paragraph(rng)}<span>"
+                           f"{_sentence(rng)}</span></div>")
+
+        elif kind < 0.85:
+
+            article.append(f"<table><tr><td><p>{_paragraph(rng)}</p></td>"
+                           f"<td>{_sentence(rng, 3)}</td></tr></table>")
+
+        elif kind < 0.9:
+
+            article.append(f"<div hidden><p>{_paragraph(rng)}</p>"
+                           "<meta name=\"description\" content=\"hidden\"></div>")
+
+        elif kind < 0.95:
+
+            article.append(f"<blockquote><p>{_paragraph(rng)}</p></blockquote>")
+
+        else:
+
+            article.append(f"<ul><li>{_sentence(rng)}</li>"
+                           f"<li><p>{_paragraph(rng)}</p></li></ul>")
+
+    body.append("<div class=\"article-body\">" + "\n".join(article) + "</div>")
+    body.append(f"<div class=\"footer\"><p>{_sentence(rng, 6)}</p></div>")
+
+    return (
+        "<!DOCTYPE html><html><head>" + "\n".join(head) + "</head><body>"
+        + "\n".join(body) + "</body></html>")
+
+
+def _generated(count, seed):
+
+    rng = random.Random(seed)
+
+    for i in range(count):
+
+        archive = "http://web.archive.org/web/20170101000000id_/" \
+            f"http://a.com/story/{i}"
+
+        yield archive, _page(i, rng)
+
+
+def _archived(path, limit):
+
+    with jsonl.open(path) as f:
+
+        for i, page in enumerate(f.readlines(ignore_errors = True)):
+
+            if limit and i >= limit:
+
+                return
+
+            yield page.get("archive", page.get("url")), page_html(page)
+
+
+def _files(directory, limit):
+
+    paths = sorted(glob.glob(os.path.join(directory, "**", "*.htm*"),
+        recursive = True))
+
+    for path in paths[:limit or None]:
+
+        with open(path, "r", encoding = "utf-8", errors = "replace") as f:
+
+            yield "http://web.archive.org/web/20170101000000id_/" \
+                "http://a.com/" + os.path.basename(path), f.read()
+
+################################################################################
+
+def _extract(archive, html, legacy, skip = False):
+
+    start = time.perf_counter()
+
+    try:
+
+        article = Article(archive, html, legacy = legacy,
+            skip_unsummarized = skip)
+
+        result, skipped = article.serialize(), article.skipped
+
+    except Exception:
+
+        result, skipped = None, None
+
+    return result, skipped, time.perf_counter() - start
+
+
+def _same(legacy, single, skipped):
+
+    if skipped is None:
+
+        return legacy == single
+
+    return legacy is not None and legacy["summary"] is None \
+        and single["summary"] is None and single["text"] is None
+
+
+@click.command()
+
+@click.option(
+    "--archive",
+    type = click.Path(exists = True),
+    default = None,
+    help = "Archive of downloaded pages to compare on.",
+)
+
+@click.option(
+    "--html-dir",
+    type = click.Path(exists = True, file_okay = False),
+    default = None,
+    help = "Directory of HTML files to compare on.",
+)
+
+@click.option(
+    "--limit",
+    type = int,
+    default = None,
+    help = "Max pages to compare. [default = all, or 500 generated]",
+)
+
+@click.option(
+    "--skip-unsummarized",
+    is_flag = True,
+    help = "Skip pages without a summary on the single-parse path.",
+)
+
+@click.option(
+    "--seed",
+    type = int,
+    default = 0,
+    help = "Seed of the generated corpus. [default = 0]",
+)
+
+################################################################################
+
+def main(archive, html_dir, limit, skip_unsummarized, seed):
+
+    if archive:
+
+        pages = _archived(archive, limit)
+
+    elif html_dir:
+
+        pages = _files(html_dir, limit)
+
+    else:
+
+        pages = _generated(limit or 500, seed)
+
+    count = mismatches = 0
+    legacy_time = single_time = 0.0
+    skips = {"head": 0, "tree": 0}
+
+    for archive_url, html in pages:
+
+        # Alternate which path runs first, so caches favor neither.
+
+        if count % 2:
+
+            single, skipped, single_t = _extract(
+                archive_url, html, False, skip_unsummarized)
+            legacy, _, legacy_t = _extract(archive_url, html, True)
+
+        else:
+
+            legacy, _, legacy_t = _extract(archive_url, html, True)
+            single, skipped, single_t = _extract(
+                archive_url, html, False, skip_unsummarized)
+
+        count += 1
+        legacy_time += legacy_t
+        single_time += single_t
+
+        if skipped:
+
+            skips[skipped] += 1
+
+        if not _same(legacy, single, skipped):
+
+            mismatches += 1
+            print("Mismatch:", archive_url)
+
+    if not count:
+
+        print("No pages.")
+        return
+
+    print(count, "pages,", mismatches, "mismatches.")
+    print("Legacy:        %.2f ms/page" % (1000 * legacy_time / count))
+    print("Single parse:  %.2f ms/page" % (1000 * single_time / count))
+    print("Speedup:       %.2fx" % (legacy_time / max(single_time, 1e-9)))
+
+    if skip_unsummarized:
+
+        print("Skipped without a summary: %d from the head alone, "
+              "%d after a full parse" % (skips["head"], skips["tree"]))
+
+    if mismatches:
+
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+
+    main()
+
+################################################################################
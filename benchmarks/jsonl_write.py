@@ -0,0 +1,98 @@
+################################################################################
+
+# Compare the per-line, buffered and multi-threaded jsonl write paths.
+#
+#   python benchmarks/jsonl_write.py --lines 20000 --size 20000
+
+import click, os, tempfile, time
+
+from newsroom import jsonl
+
+################################################################################
+
+def _records(lines, size):
+
+    body = "lorem ipsum dolor sit amet " * (size // 27 + 1)
+
+    for i in range(lines):
+
+        yield {
+            "archive": "http://web.archive.org/web/2017id_/http://a.com/" + str(i),
+            "html": body[:size],
+        }
+
+
+def _time_write(path, lines, size, **kwargs):
+
+    if os.path.isfile(path):
+        os.remove(path)
+
+    start = time.perf_counter()
+
+    with jsonl.open(path, gzip = True, **kwargs) as f:
+
+        for record in _records(lines, size):
+            f.appendline(record)
+
+    elapsed = time.perf_counter() - start
+
+    with jsonl.open(path, gzip = True) as f:
+        assert len(f) == lines
+
+    return elapsed, os.path.getsize(path)
+
+################################################################################
+
+@click.command()
+
+@click.option(
+    "--lines",
+    type = int,
+    default = 20000,
+    help = "Number of records to write. [default = 20000]",
+)
+
+@click.option(
+    "--size",
+    type = int,
+    default = 20000,
+    help = "Approximate bytes of HTML per record. [default = 20000]",
+)
+
+@click.option(
+    "--buffer",
+    type = int,
+    default = 2 ** 22,
+    help = "Buffered writer batch size in bytes. [default = 4 MB]",
+)
+
+################################################################################
+
+def main(lines, size, buffer):
+
+    with tempfile.TemporaryDirectory() as tmp:
+
+        path = os.path.join(tmp, "bench.jsonl.gz")
+
+        runs = [
+            ("per-line", {}),
+            ("buffered", {"buffer": buffer}),
+            ("threaded", {"buffer": buffer, "threads": 0}),
+        ]
+
+        for name, kwargs in runs:
+
+            elapsed, disk = _time_write(path, lines, size, **kwargs)
+
+            print(
+                f"{name:>10}: {elapsed:8.2f} sec",
+                f"{lines / elapsed:10.0f} lines/sec",
+                f"{disk / 2 ** 20:8.1f} MB on disk",
+            )
+
+
+if __name__ == "__main__":
+
+    main()
+
+################################################################################
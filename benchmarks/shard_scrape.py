@@ -0,0 +1,117 @@
+################################################################################
+
+# Scrape a URL list on several processes with --shard i/N, as separate
+# nodes would, against the local stand-in for the Wayback Machine (see
+# cdx_server.py), then combine the shards with newsroom-merge:
+#
+#   python benchmarks/shard_scrape.py --pages 400 --nodes 4 --dir /tmp/shards
+
+import click, os, subprocess, sys, time
+
+from newsroom import jsonl
+
+################################################################################
+
+_scrape = "from newsroom.build.scrape import main; main()"
+_merge = "from newsroom.build.merge import main; main()"
+
+
+def _run(code, *args):
+
+    return subprocess.Popen([sys.executable, "-c", code] + list(args),
+        stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True)
+
+################################################################################
+
+@click.command()
+
+@click.option(
+    "--pages",
+    type = int,
+    default = 400,
+    help = "Number of captured pages. [default = 400]",
+)
+
+@click.option(
+    "--nodes",
+    type = int,
+    default = 4,
+    help = "Number of scrape processes. [default = 4]",
+)
+
+@click.option(
+    "--dir",
+    "directory",
+    type = click.Path(file_okay = False),
+    required = True,
+    help = "Directory for the URL file, shards and merged archive.",
+)
+
+@click.option(
+    "--port",
+    type = int,
+    default = 8790,
+    help = "Port of the mock server. [default = 8790]",
+)
+
+################################################################################
+
+def main(pages, nodes, directory, port):
+
+    os.makedirs(directory, exist_ok = True)
+
+    urls = os.path.join(directory, "urls.txt")
+    archive = os.path.join(directory, "test.archive")
+    cdx = f"http://127.0.0.1:{port}/cdx/search/cdx"
+
+    server = subprocess.Popen([sys.executable,
+        os.path.join(os.path.dirname(__file__), "cdx_server.py"),
+        "--pages", str(pages), "--urls", urls, "--port", str(port)])
+
+    try:
+
+        time.sleep(1)
+
+        # Every node resolves the URLs that fail, so all should succeed.
+
+        start = time.time()
+
+        scrapes = [_run(_scrape, "--urls", urls, "--archive", archive,
+                        "--shard", f"{i}/{nodes}", "--sleep", "0",
+                        "--resolve", "--cdx", cdx)
+                   for i in range(nodes)]
+
+        for i, scrape in enumerate(scrapes):
+
+            scrape.communicate()
+            print(f"shard {i}/{nodes} exited with", scrape.returncode)
+
+        print("Scraped in %.1fs" % (time.time() - start))
+
+        merge = _run(_merge, "--archive", archive, "--urls", urls)
+        print(merge.communicate()[0])
+
+        with jsonl.open(archive) as f:
+
+            merged = [entry["archive"] for entry in
+                      f.readlines(fields = ["archive"])]
+
+        with open(urls) as f:
+
+            expected = [line.strip() for line in f]
+
+        print("Merged", len(merged), "entries,", len(set(merged)), "unique,",
+              "expected", len(expected))
+
+        assert sorted(merged) == sorted(expected)
+
+    finally:
+
+        server.terminate()
+
+
+if __name__ == "__main__":
+
+    main()
+
+################################################################################
@@ -0,0 +1,256 @@
+import os, json, zlib, hashlib, threading
+
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
+
+_ports = {"http": "80", "https": "443"}
+
+
+def normalize(url):
+
+    """
+
+    Normalize a URL for use as a cache key: the scheme and host are
+    lowercased, default ports and fragments dropped, and http and https
+    treated alike (archive.org serves the same capture on both).
+
+    """
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+
+    if parts.port is not None and str(parts.port) != _ports.get(scheme):
+
+        host += ":" + str(parts.port)
+
+    if scheme in _ports:
+
+        scheme = "http"
+
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def key(url):
+
+    """
+
+    Hex digest of a normalized URL, naming its cache entry.
+
+    """
+
+    return hashlib.blake2b(
+        normalize(url).encode("utf-8"), digest_size = 16).hexdigest()
+
+
+class Cache(object):
+
+    def __init__(self, path, size = 10 * 2 ** 30, level = 6):
+
+        """
+
+        On-disk cache of HTTP responses, so that pages fetched by earlier
+        scrapes are not downloaded again.
+
+        Each response body is stored zlib compressed, with the headers
+        needed to decode it, in a file named by the hash of its normalized
+        URL (see normalize). When the cache grows past its size budget,
+        least recently used entries are deleted. Recency survives restarts
+        through file modification times.
+
+        Arguments:
+
+            - path: cache directory (created if needed)
+            - size: budget in bytes of compressed entries (default = 10 GB)
+            - level: zlib compression level (default = 6)
+
+        Example:
+
+            >>> cache = Cache("pages.cache")
+            >>> cache.put(url, content, {"Content-Type": "text/html"})
+            >>> content, headers = cache.get(url)
+
+        """
+
+        self.path = path
+        self.size = size
+        self.level = level
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total = 0
+
+        os.makedirs(path, exist_ok = True)
+
+        # Rebuild the LRU order from modification times.
+
+        found = []
+
+        for bucket in os.scandir(path):
+
+            if not bucket.is_dir():
+
+                continue
+
+            for entry in os.scandir(bucket.path):
+
+                if entry.name.endswith(".tmp"):
+
+                    continue
+
+                stat = entry.stat()
+                found.append(
+                    (stat.st_mtime, bucket.name + entry.name, stat.st_size))
+
+        for _, name, length in sorted(found):
+
+            self._entries[name] = length
+            self._total += length
+
+
+    def __len__(self):
+
+        return len(self._entries)
+
+
+    def __contains__(self, url):
+
+        return key(url) in self._entries
+
+
+    def _file(self, name):
+
+        return os.path.join(self.path, name[:2], name[2:])
+
+
+    def get(self, url):
+
+        """
+
+        Look up a cached response.
+
+        Returns:
+
+            (content, headers), or None if the URL is not cached
+
+        """
+
+        name = key(url)
+
+        with self._lock:
+
+            if name not in self._entries:
+
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(name)
+
+        try:
+
+            with open(self._file(name), "rb") as f:
+
+                data = zlib.decompress(f.read())
+
+            os.utime(self._file(name))
+
+        except (OSError, zlib.error):
+
+            with self._lock:
+
+                self._total -= self._entries.pop(name, 0)
+                self.misses += 1
+
+            return None
+
+        meta, _, content = data.partition(b"\n")
+
+        with self._lock:
+
+            self.hits += 1
+
+        return content, json.loads(meta.decode("utf-8"))
+
+
+    def put(self, url, content, headers):
+
+        """
+
+        Cache a response, evicting old entries to stay within budget.
+
+        Arguments:
+
+            - url: URL the response was downloaded from
+            - content: raw response body (bytes)
+            - headers: response headers (only Content-Type is kept)
+
+        """
+
+        name = key(url)
+        meta = {"Content-Type": headers.get("Content-Type")}
+
+        data = zlib.compress(
+            json.dumps(meta).encode("utf-8") + b"\n" + content, self.level)
+
+        file = self._file(name)
+        tmp = file + "." + str(threading.get_ident()) + ".tmp"
+
+        os.makedirs(os.path.dirname(file), exist_ok = True)
+
+        with open(tmp, "wb") as f:
+
+            f.write(data)
+
+        os.replace(tmp, file)
+
+        with self._lock:
+
+            self._total += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+
+            evicted = []
+
+            while self._total > self.size and len(self._entries) > 1:
+
+                old, size = self._entries.popitem(last = False)
+                self._total -= size
+                evicted.append(old)
+
+        for old in evicted:
+
+            try:
+
+                os.remove(self._file(old))
+
+            except OSError:
+
+                pass
+
+
+    def clear(self):
+
+        """
+
+        Delete every cached response.
+
+        """
+
+        with self._lock:
+
+            names = list(self._entries)
+            self._entries.clear()
+            self._total = 0
+
+        for name in names:
+
+            try:
+
+                os.remove(self._file(name))
+
+            except OSError:
+
+                pass
@@ -0,0 +1,280 @@
+import os, threading, requests
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .ratelimit import RateLimiter, retry_after
+from . import jsonl
+
+
+endpoint = "http://web.archive.org/cdx/search/cdx"
+
+
+def split(archive):
+
+    """
+
+    Split a Wayback URL into its parts, e.g.:
+
+        http://web.archive.org/web/20170101000000id_/http://a.com/x
+        -> ("http://web.archive.org/web/", "20170101000000", "http://a.com/x")
+
+    Returns None if the URL is not a Wayback "id_" capture URL.
+
+    """
+
+    before, found, original = archive.partition("id_/")
+
+    if not found:
+
+        return None
+
+    prefix, _, timestamp = before.rpartition("/")
+
+    return prefix + "/", timestamp, original
+
+
+class Resolver(object):
+
+    def __init__(
+
+            self,
+            path = None,
+            endpoint = endpoint,
+            workers = 4,
+            sleep = 1,
+            tries = 3,
+            timeout = 30,
+
+            ):
+
+        """
+
+        Find the nearest real capture of Wayback URLs with the CDX API,
+        instead of hoping for a redirect from a truncated timestamp.
+
+        Lookups are made in batches on a small thread pool, sharing an
+        adaptive rate limit (see RateLimiter). Every answer, including
+        "no capture", is cached in a JSON lines file, so each archive URL
+        is only ever looked up once.
+
+        Arguments:
+
+            - path: cache file of resolved URLs (default = None, no cache)
+            - endpoint: CDX API URL (default = web.archive.org)
+            - workers: concurrent lookups (default = 4)
+            - sleep: initial delay between lookups per worker (default = 1)
+            - tries: attempts per lookup (default = 3)
+            - timeout: seconds before a lookup times out (default = 30)
+
+        Example:
+
+            >>> resolver = Resolver("dev.archive.cdx")
+            >>> resolver.resolve([archive_url])
+            {archive_url: "http://web.archive.org/web/2017...id_/..."}
+
+        """
+
+        self.path = path
+        self.endpoint = endpoint
+        self.workers = workers
+        self.tries = tries
+        self.timeout = timeout
+
+        self.limiter = RateLimiter(workers / sleep) if sleep else None
+
+        self.cache = {}
+        self._local = threading.local()
+
+        if path and os.path.exists(path):
+
+            with jsonl.open(path) as f:
+
+                for entry in f.readlines(ignore_errors = True):
+
+                    self.cache[entry["archive"]] = entry["snapshot"]
+
+
+    def __contains__(self, archive):
+
+        return archive in self.cache
+
+
+    def get(self, archive):
+
+        """
+
+        Cached snapshot URL of an archive URL (None if unknown).
+
+        """
+
+        return self.cache.get(archive)
+
+
+    def _session(self):
+
+        session = getattr(self._local, "session", None)
+
+        if session is None:
+
+            session = self._local.session = requests.Session()
+
+        return session
+
+
+    def lookup(self, archive):
+
+        """
+
+        Ask the CDX API for the capture closest to an archive URL.
+
+        Returns:
+
+            snapshot URL, or None if there is no usable capture
+
+        Raises:
+
+            IOError if the CDX API could not be reached
+
+        """
+
+        parts = split(archive)
+
+        if parts is None:
+
+            return None
+
+        prefix, timestamp, original = parts
+
+        params = [
+            ("url", original),
+            ("closest", timestamp),
+            ("sort", "closest"),
+            ("limit", "1"),
+            ("filter", "statuscode:200"),
+            ("filter", "mimetype:text/html"),
+            ("fl", "timestamp,original"),
+            ("output", "json"),
+        ]
+
+        for _ in range(self.tries):
+
+            if self.limiter:
+
+                self.limiter.wait()
+
+            try:
+
+                req = self._session().get(
+                    self.endpoint, params = params, timeout = self.timeout)
+
+            except requests.RequestException:
+
+                if self.limiter:
+
+                    self.limiter.throttled()
+
+                continue
+
+            if req.status_code in (429, 503):
+
+                if self.limiter:
+
+                    self.limiter.throttled(
+                        retry_after(req.headers.get("Retry-After")))
+
+                continue
+
+            if req.status_code != 200:
+
+                continue
+
+            if self.limiter:
+
+                self.limiter.success()
+
+            try:
+
+                rows = req.json() if req.content.strip() else []
+
+            except ValueError:
+
+                continue
+
+            # The first row is the header (field names).
+
+            if len(rows) < 2:
+
+                return None
+
+            timestamp, original = rows[1][:2]
+
+            return prefix + timestamp + "id_/" + original
+
+        raise IOError("CDX lookup failed: " + archive)
+
+
+    def _lookup(self, archive):
+
+        try:
+
+            return True, self.lookup(archive)
+
+        except IOError:
+
+            return False, None
+
+
+    def resolve(self, archives, batch_size = 1000, progress = None):
+
+        """
+
+        Resolve many archive URLs, using and filling the cache.
+
+        Arguments:
+
+            - archives: iterable of archive URLs
+            - batch_size: lookups between cache writes (default = 1000)
+            - progress: called with the number of URLs in each finished
+              batch (default = None)
+
+        Returns:
+
+            {archive: snapshot URL or None} for every archive URL that
+            was resolved, or found in the cache (failed lookups are left
+            out, and retried next time)
+
+        """
+
+        archives = list(dict.fromkeys(archives))
+        todo = [archive for archive in archives if archive not in self.cache]
+
+        with ThreadPoolExecutor(self.workers) as executor:
+
+            for start in range(0, len(todo), batch_size):
+
+                batch = todo[start:start + batch_size]
+                found = []
+
+                for archive, (ok, snapshot) in zip(
+                        batch, executor.map(self._lookup, batch)):
+
+                    if ok:
+
+                        self.cache[archive] = snapshot
+                        found.append({"archive": archive, "snapshot": snapshot})
+
+                if self.path and found:
+
+                    with jsonl.open(self.path) as f:
+
+                        f.append(found)
+
+                if progress:
+
+                    progress(len(batch))
+
+        return {
+            archive: self.cache[archive]
+            for archive in archives
+            if archive in self.cache
+        }
@@ -0,0 +1,140 @@
+import codecs, re
+
+from bs4 import UnicodeDammit
+
+
+# Pages declare their charset in a <meta> tag near the top, if anywhere.
+
+_meta = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_.:-]+)""",
+    re.IGNORECASE)
+
+_sniff = 4096
+
+
+def _codec(name):
+
+    # Canonical Python codec name, or None if unknown.
+
+    try:
+
+        return codecs.lookup(name.strip().strip("\"'")).name
+
+    except (LookupError, AttributeError, TypeError):
+
+        return None
+
+
+def declared(content, headers):
+
+    """
+
+    Find the charset a page declares, in its Content-Type header or in a
+    <meta> tag at the start of the page.
+
+    Arguments:
+
+        content (bytes) - raw page body
+        headers (dict) - HTTP response headers
+
+    Returns:
+
+        Python codec name, or None if nothing (known) is declared
+
+    """
+
+    content_type = headers.get("Content-Type") or ""
+
+    for param in content_type.split(";")[1:]:
+
+        key, _, value = param.partition("=")
+
+        if key.strip().lower() == "charset":
+
+            codec = _codec(value)
+
+            if codec:
+
+                return codec
+
+    match = _meta.search(content[:_sniff])
+
+    if match:
+
+        return _codec(match.group(1).decode("ascii"))
+
+    return None
+
+
+def decode_body(content, headers):
+
+    """
+
+    Cheaply decode a downloaded page without guessing its encoding.
+
+        - with a declared charset, decode with it
+        - otherwise, if the page is valid UTF-8, decode as UTF-8
+        - otherwise, keep the raw bytes, mapped one to one onto the
+          first 256 code points (as latin-1), to be decoded later by
+          page_html in the extraction workers
+
+    Arguments:
+
+        content (bytes) - raw page body
+        headers (dict) - HTTP response headers
+
+    Returns:
+
+        (html, encoding, charset), where encoding is the codec used, or
+        "raw" for undecoded bytes, and charset is the declared charset
+
+    """
+
+    charset = declared(content, headers)
+
+    if charset:
+
+        return content.decode(charset, "replace"), charset, charset
+
+    try:
+
+        return content.decode("utf-8"), "utf-8", None
+
+    except UnicodeDecodeError:
+
+        return content.decode("latin-1"), "raw", None
+
+
+def page_html(page):
+
+    """
+
+    Get the decoded HTML of an archive entry.
+
+    Entries stored as raw bytes (see decode_body) are decoded here with
+    content-based detection. Older entries are already decoded.
+
+    Arguments:
+
+        page (dict) - archive entry with "html" and maybe "encoding"
+
+    Returns:
+
+        HTML as a string
+
+    """
+
+    html = page.get("html") or ""
+
+    if page.get("encoding") != "raw":
+
+        return html
+
+    content = html.encode("latin-1")
+    markup = UnicodeDammit(content, is_html = True).unicode_markup
+
+    if markup is None:
+
+        markup = content.decode("windows-1252", "replace")
+
+    return markup
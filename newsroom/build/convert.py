@@ -0,0 +1,84 @@
+################################################################################
+
+import click
+
+from newsroom import jsonl
+
+################################################################################
+
+input_file = click.Path(
+    exists       = True,
+    dir_okay     = True,
+    readable     = True,
+    resolve_path = True,
+)
+
+output_file = click.Path(
+    dir_okay     = True,
+    writable     = True,
+    resolve_path = True,
+)
+
+################################################################################
+
+@click.command()
+
+@click.option(
+    "--input",
+    "source",
+    type = input_file,
+    required = True,
+    help = "Input path to a dataset, scores file, or Parquet file.",
+)
+
+@click.option(
+    "--output",
+    type = output_file,
+    required = True,
+    help = "Output path for the converted file.",
+)
+
+@click.option(
+    "--batch-size",
+    type = int,
+    default = 2 ** 16,
+    help = "Entries per Parquet row group. [default = 65536]",
+)
+
+@click.option(
+    "--format",
+    "compression",
+    type = click.Choice(list(jsonl.formats)),
+    default = "gzip",
+    help = "Compression of JSON lines output. [default = gzip]",
+)
+
+@click.option(
+    "--iostats",
+    is_flag = True,
+    help = "Print per-file I/O statistics on exit. [default = off]",
+)
+
+################################################################################
+
+def main(source, output, batch_size, compression, iostats):
+
+    if iostats:
+
+        jsonl.profile()
+
+    # Direction depends on the input: Parquet in, JSON lines out.
+
+    if jsonl.is_parquet(source):
+
+        print("Converting Parquet to JSON lines...")
+        count = jsonl.from_parquet(source, output, **jsonl.formats[compression])
+
+    else:
+
+        print("Converting JSON lines to Parquet...")
+        count = jsonl.to_parquet(source, output, batch_size)
+
+    print("Wrote", count, "entries to", output)
+
+################################################################################
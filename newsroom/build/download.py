@@ -1,5 +1,57 @@
-import time, random, requests
-from concurrent.futures import ThreadPoolExecutor
+import requests, threading, queue, asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .ratelimit import RateLimiter, retry_after
+from .schedule import Scheduler
+from .charset import decode_body
+
+
+def _aiohttp():
+
+    try:
+
+        import aiohttp
+
+    except ImportError:
+
+        raise ImportError(
+            "The async download engine requires aiohttp: "
+            "pip install newsroom[async]")
+
+    return aiohttp
+
+
+def _page(url, content, headers):
+
+    # Pages are decoded cheaply here, and any guessing of undeclared
+    # encodings is left to the extraction workers (see charset.py).
+
+    html, encoding, charset = decode_body(content, headers)
+
+    return {
+        "url": url,
+        "html": html,
+        "encoding": encoding,
+        "charset": charset,
+    }
+
+
+def _skipped(url, reason):
+
+    # Pages deliberately not downloaded, kept apart from failures (None).
+
+    return {
+        "url": url,
+        "skipped": reason,
+    }
+
+
+_chunk = 2 ** 16
+
+# URLs queued per worker for per-host scheduling.
+
+_lookahead = 64
 
 
 class Downloader(object):
@@ -11,6 +63,15 @@ class Downloader(object):
             tries = 3,
             sleep = 2,
             multiplier = 1.5,
+            engine = "threads",
+            connections = None,
+            timeout = 60,
+            max_rate = None,
+            max_size = None,
+            content_types = None,
+            compress = True,
+            per_host = None,
+            cache = None,
 
             ):
 
@@ -22,10 +83,49 @@ class Downloader(object):
         Arguments:
 
             - workers: the number of threads to launch (default = 8)
+                * with the async engine, requests in flight at once
             - tries: download attempts to make after a failure (default = 3)
             - sleep: approx thread wait time between downloads (default = 2)
-                * (approximate rate is workers/sleep URLs per second)
-            - multiplier: increase sleep time on each try (default = 1.5)
+                * (initial rate is workers/sleep URLs per second)
+                * 0 disables rate limiting
+            - multiplier: divide the rate when throttled (default = 1.5)
+            - engine: "threads" or "async" (default = "threads")
+                * "async" runs every request on one thread with asyncio
+                  and aiohttp, so hundreds of workers are cheap
+            - connections: max open keep-alive connections for the
+              async engine (default = workers)
+            - timeout: seconds before a request times out (default = 60)
+            - max_rate: cap on URLs per second (default = None)
+            - max_size: max bytes of page body to download (default = None)
+            - content_types: media types to download, e.g.
+              ["text/html"], or None for any (default = None)
+            - compress: accept compressed transfers (default = True)
+            - per_host: schedule downloads per host, with at most this
+              many requests to each host at once (default = None)
+            - cache: a Cache of responses to serve pages from before
+              downloading them, and to store new ones in (default = None)
+
+        Bodies are streamed, and pages with another content type, or that
+        grow larger than max_size, are abandoned as soon as that is known.
+        They are returned as {"url": ..., "skipped": "content-type" or
+        "size"} instead of None, so callers can tell them from failures.
+
+        Both engines reuse connections: threads keep a requests.Session
+        each, and the async engine shares a bounded connection pool.
+
+        All workers share one adaptive rate limiter (see RateLimiter).
+        The rate grows while downloads succeed and is divided by the
+        multiplier when the server throttles (429 or 503) or requests time
+        out, respecting Retry-After. The current rate is self.rate().
+
+        With per_host, every host gets its own queue and rate limit
+        instead (see Scheduler), and threads take work round robin from
+        the hosts that are ready, so one throttled host does not starve
+        the others. Failed URLs are queued again rather than retried on
+        the spot. This uses the threads engine.
+
+        With a cache, cached pages are returned without a request (or a
+        rate limit token), and every page downloaded is added to it.
 
         Example:
 
@@ -34,52 +134,659 @@ class Downloader(object):
 
         """
 
+        if engine not in ("threads", "async"):
+
+            raise ValueError("unknown download engine: " + str(engine))
+
+        if per_host and engine != "threads":
+
+            raise ValueError("per-host scheduling needs the threads engine")
+
         self.workers = workers
         self.tries = tries
         self.sleep = sleep
         self.multiplier = multiplier
+        self.engine = engine
+        self.connections = connections or workers
+        self.timeout = timeout
+        self.max_size = max_size
+
+        self.content_types = None if content_types is None \
+            else {kind.strip().lower() for kind in content_types}
+
+        self.headers = None if compress \
+            else {"Accept-Encoding": "identity"}
+
+        self.per_host = per_host
+        self.max_rate = max_rate
+        self.scheduler = None
+        self.cache = cache
+
+        self.limiter = RateLimiter(
+            workers / sleep,
+            multiplier = multiplier,
+            maximum = max_rate) if sleep and not per_host else None
+
+        self._local = threading.local()
 
 
-    def download(self, urls):
+    def rate(self):
+
+        """
+
+        Current allowed rate in URLs per second (None if unlimited).
+
+        """
+
+        if self.scheduler is not None:
+
+            limiters = [state.limiter for state in
+                        list(self.scheduler.hosts.values()) if state.limiter]
+
+            return sum(limiter.rate for limiter in limiters) \
+                if limiters else None
+
+        return self.limiter.rate if self.limiter else None
+
+
+    def _cached(self, url):
+
+        # The page from the cache, or None.
+
+        if self.cache is None:
+
+            return None
+
+        response = self.cache.get(url)
+
+        return None if response is None else _page(url, *response)
+
+
+    def _fetched(self, url, content, headers):
+
+        # Cache a downloaded page and decode it.
+
+        if self.cache is not None:
+
+            self.cache.put(url, content, headers)
+
+        return _page(url, content, headers)
+
+
+    def _skip(self, headers):
+
+        # Reason to skip a response based on its headers, if any.
+
+        if self.content_types is not None:
+
+            kind = (headers.get("Content-Type") or "").split(";")[0]
+            kind = kind.strip().lower()
+
+            if kind and kind not in self.content_types:
+
+                return "content-type"
+
+        if self.max_size is not None:
+
+            try:
+
+                length = int(headers.get("Content-Length") or 0)
+
+            except ValueError:
+
+                length = 0
+
+            if length > self.max_size:
+
+                return "size"
+
+        return None
+
+
+    def _oversize(self, size):
+
+        return self.max_size is not None and size > self.max_size
+
+
+    def _feedback(self, status, headers = None, limiter = None):
+
+        # Tell the rate limiter how a request went. Other failures (e.g.,
+        # missing pages) are retried without changing the rate.
+
+        limiter = limiter or self.limiter
+
+        if not limiter:
+
+            return
+
+        if status == 200:
+
+            limiter.success()
+
+        elif status in (429, 503) or status is None:
+
+            limiter.throttled(
+                retry_after((headers or {}).get("Retry-After")))
+
+
+    def download(self, urls, ordered = True, inflight = None):
 
         """
 
         Download a thing.
 
+        Arguments:
+
+            - urls: iterable of URLs, consumed lazily when "inflight" is set
+            - ordered: yield results in input order (default = True)
+                * otherwise, yield each page as soon as it is downloaded
+            - inflight: max URLs downloading or downloaded but not yet
+              consumed (default = unbounded if ordered, else 2 * workers)
+
+        Yields:
+
+            {"url", "html", "encoding", "charset"} for each URL, or None
+            if it failed (see charset.decode_body for the encoding), or
+            {"url", "skipped"} if it was skipped
+
+        With ordered = False (or an "inflight" cap), memory stays flat no
+        matter how many URLs there are, and one slow URL does not hold
+        back finished pages.
+
         """
 
-        urls = list(urls)
+        if inflight is None and not ordered:
+
+            inflight = 2 * self.workers
+
+        if inflight is not None:
+
+            inflight = max(inflight, 1)
+
+        if self.per_host:
+
+            yield from self._download_scheduled(urls, ordered, inflight)
+
+        elif self.engine == "async":
+
+            yield from self._download_async(urls, ordered, inflight)
+
+        elif inflight is None:
+
+            urls = list(urls)
+
+            with ThreadPoolExecutor(self.workers) as executor:
+
+                yield from executor.map(self._thread, urls)
+
+        else:
+
+            yield from self._download_threads(urls, ordered, inflight)
+
+
+    def _download_threads(self, urls, ordered, inflight):
+
+        # Keep at most "inflight" futures, submitting one URL per result.
+
+        pending = deque() if ordered else set()
 
         with ThreadPoolExecutor(self.workers) as executor:
 
-            yield from executor.map(self._thread, urls)
+            try:
+
+                for url in urls:
+
+                    if len(pending) >= inflight:
+
+                        yield from self._finished(pending, ordered)
+
+                    future = executor.submit(self._thread, url)
+
+                    if ordered:
+
+                        pending.append(future)
+
+                    else:
+
+                        pending.add(future)
+
+                while pending:
+
+                    yield from self._finished(pending, ordered)
+
+            finally:
+
+                for future in pending:
+
+                    future.cancel()
+
+
+    def _finished(self, pending, ordered):
+
+        # Yield the next result in order, or every result that is ready.
+
+        if ordered:
+
+            yield pending.popleft().result()
+            return
+
+        done, _ = wait(pending, return_when = FIRST_COMPLETED)
+
+        for future in done:
+
+            pending.remove(future)
+            yield future.result()
+
+
+    def _session(self):
+
+        # One keep-alive session per worker thread.
+
+        session = getattr(self._local, "session", None)
+
+        if session is None:
+
+            session = self._local.session = requests.Session()
+
+        return session
 
 
     def _thread(self, url):
 
-        sleep = self.sleep
+        page = self._cached(url)
+
+        if page is not None:
+
+            return page
 
         for _ in range(self.tries):
 
-            time.sleep(random.random() * sleep * 2)
+            if self.limiter:
 
-            try:
+                self.limiter.wait()
+
+            page = self._get(url)
+
+            if page is not None:
+
+                return page
+
+        return None
+
+
+    def _get(self, url, limiter = None):
+
+        # Make one attempt. Returns the page (or why it was skipped), or
+        # None if it failed.
+
+        try:
+
+            with self._session().get(url, timeout = self.timeout,
+                    headers = self.headers, stream = True) as req:
+
+                self._feedback(req.status_code, req.headers, limiter)
+
+                if req.status_code != 200:
+
+                    return None
+
+                skip = self._skip(req.headers)
+
+                if skip:
+
+                    return _skipped(url, skip)
 
-                req = requests.get(url)
+                chunks, size = [], 0
 
-                if req.status_code == 200:
+                for chunk in req.iter_content(_chunk):
 
-                    return {
-                        "url": url,
-                        "html": req.text
-                    }
+                    size += len(chunk)
+
+                    if self._oversize(size):
+
+                        return _skipped(url, "size")
+
+                    chunks.append(chunk)
+
+                return self._fetched(url, b"".join(chunks), req.headers)
+
+        except requests.Timeout:
+
+            self._feedback(None, limiter = limiter)
+
+        except Exception:
+
+            pass
+
+        return None
+
+
+    def _download_scheduled(self, urls, ordered, inflight):
+
+        # Threads take jobs from the per-host scheduler, while URLs are
+        # added to it lazily. Unordered, up to "inflight" pages are in
+        # flight or waiting to be consumed, and many more URLs are queued
+        # so that every host has work. Ordered, "inflight" bounds both.
+
+        scheduler = self.scheduler = Scheduler(
+            per_host = self.per_host,
+            rate = self.per_host / self.sleep if self.sleep else None,
+            multiplier = self.multiplier,
+            maximum = self.max_rate)
+
+        if ordered:
+
+            window = inflight or 2 * self.workers
+            slots = None
+
+        else:
+
+            window = max(inflight, _lookahead * self.workers)
+            slots = threading.Semaphore(inflight)
+
+        results = queue.Queue()
+
+        def worker():
+
+            while True:
+
+                if slots:
+
+                    slots.acquire()
+
+                job = scheduler.take()
+
+                if job is None:
+
+                    return
+
+                page = self._get(job.url, scheduler.limiter(job.host))
+
+                if page is None and job.attempts + 1 < self.tries:
+
+                    scheduler.finish(job, retry = True)
+
+                    if slots:
+
+                        slots.release()
 
                 else:
 
-                    raise Exception()
+                    scheduler.finish(job)
+                    results.put((job.index, page))
+
+        threads = [threading.Thread(target = worker, daemon = True)
+                   for _ in range(self.workers)]
+
+        for thread in threads:
+
+            thread.start()
+
+        jobs = enumerate(urls)
+        added = consumed = 0
+        exhausted = False
+
+        done = {}
+        i = 0
+
+        try:
+
+            while True:
+
+                while not exhausted and added - consumed < window:
+
+                    job = next(jobs, None)
+
+                    if job is None:
+
+                        exhausted = True
+                        scheduler.close()
+                        continue
+
+                    added += 1
+                    page = self._cached(job[1])
+
+                    if page is None:
+
+                        scheduler.add(*job)
+
+                    elif ordered:
+
+                        done[job[0]] = page
+
+                    else:
+
+                        consumed += 1
+                        yield page
+
+                while i in done:
+
+                    consumed += 1
+                    yield done.pop(i)
+                    i += 1
+
+                if exhausted and consumed == added:
+
+                    break
+
+                j, result = results.get()
+
+                if not ordered:
+
+                    consumed += 1
+                    slots.release()
+                    yield result
+                    continue
+
+                done[j] = result
+
+                while i in done:
+
+                    consumed += 1
+                    yield done.pop(i)
+                    i += 1
+
+        finally:
+
+            scheduler.stop()
+
+            if slots:
+
+                for _ in threads:
+
+                    slots.release()
+
+
+    def _download_async(self, urls, ordered, inflight):
+
+        # Run the event loop on a background thread, and yield results
+        # in input order (like the thread pool's executor.map), or as
+        # they arrive. Each consumed result frees an in-flight slot.
+
+        _aiohttp()
+
+        results = queue.Queue()
+        stopped = threading.Event()
+        slots = {}
+
+        def run():
+
+            try:
+
+                asyncio.run(self._gather(
+                    urls, results, stopped, inflight, slots))
+
+            except BaseException as e:
+
+                results.put((None, e))
+                return
+
+            results.put((None, None))
+
+        def release():
+
+            # Fine to skip once the loop has finished every URL.
+
+            if inflight is not None:
+
+                try:
+
+                    slots["loop"].call_soon_threadsafe(
+                        slots["semaphore"].release)
+
+                except RuntimeError:
+
+                    pass
+
+        thread = threading.Thread(target = run, daemon = True)
+        thread.start()
+
+        done = {}
+        i = 0
+
+        try:
+
+            while True:
+
+                j, result = results.get()
+
+                if j is None:
+
+                    if result is not None:
+
+                        raise result
+
+                    break
+
+                if not ordered:
+
+                    release()
+                    yield result
+                    continue
+
+                done[j] = result
+
+                while i in done:
+
+                    release()
+                    yield done.pop(i)
+                    i += 1
+
+        finally:
+
+            stopped.set()
+
+            # Wake up workers waiting for a slot, so the loop can finish.
+
+            if slots:
+
+                for _ in range(self.workers):
+
+                    release()
+
+
+    async def _gather(self, urls, results, stopped, inflight, slots):
+
+        aiohttp = _aiohttp()
+
+        connector = aiohttp.TCPConnector(
+            limit = self.connections,
+            limit_per_host = self.connections)
+
+        jobs = enumerate(urls)
+
+        semaphore = asyncio.Semaphore(inflight) if inflight else None
+
+        slots["loop"] = asyncio.get_running_loop()
+        slots["semaphore"] = semaphore
+
+        timeout = aiohttp.ClientTimeout(total = self.timeout)
+
+        async with aiohttp.ClientSession(
+                connector = connector, timeout = timeout) as session:
+
+            async def worker():
+
+                while not stopped.is_set():
+
+                    # Take a slot before a URL, so the lowest unfinished
+                    # URL always holds one (and ordered output can't stall).
+
+                    if semaphore:
+
+                        await semaphore.acquire()
+
+                    job = next(jobs, None)
+
+                    if job is None:
+
+                        if semaphore:
+
+                            semaphore.release()
+
+                        return
+
+                    i, url = job
+
+                    results.put((i, await self._fetch(session, url, stopped)))
+
+            await asyncio.gather(*[worker() for _ in range(self.workers)])
+
+
+    async def _fetch(self, session, url, stopped):
+
+        page = self._cached(url)
+
+        if page is not None:
+
+            return page
+
+        for _ in range(self.tries):
+
+            if self.limiter:
+
+                await self.limiter.wait_async()
+
+            if stopped.is_set():
+
+                return None
+
+            try:
+
+                async with session.get(url, headers = self.headers) as req:
+
+                    self._feedback(req.status, req.headers)
+
+                    if req.status != 200:
+
+                        continue
+
+                    skip = self._skip(req.headers)
+
+                    if skip:
+
+                        return _skipped(url, skip)
+
+                    chunks, size = [], 0
+
+                    async for chunk in req.content.iter_chunked(_chunk):
+
+                        size += len(chunk)
+
+                        if self._oversize(size):
+
+                            return _skipped(url, "size")
+
+                        chunks.append(chunk)
+
+                    return self._fetched(url, b"".join(chunks), req.headers)
+
+            except asyncio.TimeoutError:
+
+                self._feedback(None)
 
             except Exception:
 
-                sleep *= self.multiplier
+                pass
 
         return None
@@ -2,11 +2,13 @@
 
 from tqdm import tqdm
 
-import click, os
-from multiprocessing import cpu_count
-from concurrent.futures import ProcessPoolExecutor
+import click, os, queue, threading
+from functools import partial
+from itertools import chain
+from multiprocessing import cpu_count, Pool
 
 from . import Article
+from .urlset import URLSet
 
 from newsroom import jsonl
 from newsroom.analyze import Fragments
@@ -15,13 +17,13 @@ from newsroom.analyze import Fragments
 
 archive_file = click.Path(
     exists       = True,
-    dir_okay     = False,
+    dir_okay     = True,
     readable     = True,
     resolve_path = True,
 )
 
 dataset_file = click.Path(
-    dir_okay     = False,
+    dir_okay     = True,
     readable     = True,
     writable     = True,
     resolve_path = True,
@@ -51,6 +53,68 @@ def binner(value, cutoffs, levels):
 
 ################################################################################
 
+def _process(page, skip_unsummarized = False):
+
+    # Extract one archived page and compute its fragment statistics.
+
+    result = Article.process(page, skip_unsummarized)
+
+    if result is None:
+
+        return None
+
+    if result["text"] is None or result["summary"] is None:
+
+        return result
+
+    fragments = Fragments(result["summary"], result["text"])
+
+    result["compression"] = fragments.compression()
+    result["coverage"] = fragments.coverage()
+    result["density"] = fragments.density()
+
+    for measure in ("compression", "coverage", "density"):
+
+        result[measure + "_bin"] = binner(
+            result[measure],
+            cutoffs[measure],
+            levels[measure])
+
+    return result
+
+
+_done = None
+
+
+def _init(done):
+
+    # Runs once in each worker: URLs finished before the run started.
+
+    global _done
+    _done = done
+
+
+def _process_range(item, skip_unsummarized = False):
+
+    # Read and extract the pages in a (path, offset, length) range of the
+    # archive, so only finished entries are sent back to the main process.
+
+    results = []
+    seen = set()
+
+    for page in jsonl.readrange(*item, ignore_errors = True):
+
+        url = page.get("archive", page.get("url"))
+
+        if url is None or url in seen or url in _done: continue
+
+        seen.add(url)
+        results.append(_process(page, skip_unsummarized))
+
+    return results
+
+################################################################################
+
 @click.command()
 
 @click.option(
@@ -85,12 +149,45 @@ def binner(value, cutoffs, levels):
     "--chunksize",
     type = int,
     default = cpu_count() * 20,
-    help = "Items processed between updates. [default = 20*CPUs]",
+    help = "Pages read at a time, with up to twice as many in flight. [default = 20*CPUs]",
+)
+
+@click.option(
+    "--shards",
+    type = int,
+    default = None,
+    help = "Write a new dataset as a directory of shards. [default = off]",
+)
+
+@click.option(
+    "--skip-unsummarized",
+    is_flag = True,
+    help = "Leave the text and title of pages without a summary empty "
+           "(null), instead of extracting them. [default = off]",
+)
+
+@click.option(
+    "--format",
+    "compression",
+    type = click.Choice(list(jsonl.formats)),
+    default = "gzip",
+    help = "Compression of a new dataset. [default = gzip]",
+)
+
+@click.option(
+    "--iostats",
+    is_flag = True,
+    help = "Print per-file I/O statistics on exit. [default = off]",
 )
 
 ################################################################################
 
-def main(archive, urldiff, dataset, workers, chunksize):
+def main(archive, urldiff, dataset, workers, chunksize, shards,
+        skip_unsummarized, compression, iostats):
+
+    if iostats:
+
+        jsonl.profile()
 
     if archive is None and urldiff is None:
 
@@ -100,23 +197,16 @@ def main(archive, urldiff, dataset, workers, chunksize):
 
     elif urldiff:
 
-        # Check to see if the dataset contains all URLs.
-
-        required = set()
+        # Check to see if the dataset contains all URLs, using the
+        # compact sidecar of its URLs (rebuilt if out of date).
 
         print("Comparing URL file to dataset...")
 
-        with open(urldiff, "rt") as urls_file:
+        done = URLSet.load(dataset)
 
-            for line in urls_file:
-                required.add(line.strip())
-
-        with jsonl.open(dataset, gzip = True) as dataset_file:
-
-            for article in dataset_file.readlines(ignore_errors = True):
+        with open(urldiff, "rt") as urls_file:
 
-                url = article.get("archive", article.get("url"))
-                required.discard(url)
+            required = set(done.missing(line.strip() for line in urls_file))
 
         if len(required) > 0:
 
@@ -132,89 +222,228 @@ def main(archive, urldiff, dataset, workers, chunksize):
 
         return
 
-    previously = set()
-    todo = set()
+    # The archive is read once: finished pages are skipped as they stream
+    # past, using the compact URL set of the dataset (see URLSet). The
+    # count of new pages is only known up front if the archive's own URL
+    # set is up to date, as newsroom-scrape leaves it.
 
-    if os.path.isfile(dataset):
+    if os.path.exists(dataset):
 
         print("Comparing archive and dataset files: ", end = "")
 
-        with jsonl.open(dataset, gzip = True) as dataset_file:
+        done = URLSet.load(dataset)
 
-            for article in dataset_file.readlines(ignore_errors = True):
+        print("found", len(done), "finished summaries... ", end = "")
 
-                url = article.get("archive", article.get("url"))
-                previously.add(url)
+    else:
+
+        print("Loading downloaded summaries: ", end = "")
+
+        done = URLSet()
 
-        print("found", len(previously), "finished summaries... ", end = "")
+    downloaded = URLSet.read(archive)
+    total = None
+
+    if downloaded is not None:
+
+        total = downloaded.count_missing(done)
+        print("found", total, "new summaries.\n")
 
     else:
 
-        print("Loading downloaded summaries: ", end = "")
+        print("counting new summaries as they are read.\n")
 
-    with jsonl.open(archive, gzip = True) as archive_file:
+    sent = URLSet()
+    failed = []
 
-        for article in archive_file.readlines(ignore_errors = True):
+    # With --skip-unsummarized, pages without a summary are still kept (so
+    # they are not extracted again), but readability is not run on them.
+
+    unsummarized = 0
+
+    # Workers read their own pages: each is handed a byte range of the
+    # archive, found from its index, and decodes and extracts the pages
+    # in it. Archives that cannot be split (no up to date index, since
+    # building one would read the archive twice, a single compressed
+    # stream, or smaller than a range per worker) are decoded here
+    # instead, and their pages streamed to the workers.
+
+    with jsonl.open(archive) as archive_file:
+
+        ranges = archive_file.ranges(size = 2 ** 20, build = False)
+
+    if ranges is not None and len(ranges) < workers:
+
+        ranges = None
+
+    # One pool of workers lives for the whole run. Work streams to it with
+    # imap_unordered, at most "2 * chunksize" pages or "2 * workers" ranges
+    # at a time, and workers return finished entries (with fragment
+    # statistics), which a writer thread saves as they arrive, so workers
+    # never wait on the main process.
+
+    if ranges:
+
+        process = partial(_process_range,
+            skip_unsummarized = skip_unsummarized)
+        inflight = threading.Semaphore(2 * workers)
+        per_task = 1
+
+    else:
+
+        process = partial(_process, skip_unsummarized = skip_unsummarized)
+        inflight = threading.Semaphore(2 * chunksize)
+        per_task = max(1, min(16, chunksize // (4 * workers)))
+
+    stopped = threading.Event()
+
+    def pages():
+
+        # Decode the next batch of pages while workers are busy.
+
+        batches = archive_file.readlines(
+            ignore_errors = True,
+            batch_size = chunksize,
+            workers = 1)
+
+        for article in chain.from_iterable(batches):
 
             url = article.get("archive", article.get("url"))
-            todo.add(url)
 
-    todo -= previously
+            # Skip finished pages, and duplicates of pages already sent.
+            # (The main thread only adds to "done", and only pages that
+            # are also in "sent".)
+
+            if url is None or url in sent or url in done: continue
+
+            sent.add(url)
+
+            # Wait for a finished page before sending more.
+
+            inflight.acquire()
+
+            if stopped.is_set():
+
+                return
+
+            yield article
+
+    def work():
+
+        # Archive ranges or pages, waiting for finished work before
+        # sending more.
+
+        if not ranges:
+
+            yield from pages()
+            return
 
-    print("found", len(todo), "new summaries.\n")
+        for item in ranges:
 
-    with tqdm(total = len(todo), desc = "Extracting Summaries") as progress:
-        with jsonl.open(archive, gzip = True) as archive_file:
-            with jsonl.open(dataset, gzip = True) as dataset_file:
+            inflight.acquire()
 
-                chunk = []
+            if stopped.is_set():
 
-                def process_chunk():
+                return
 
-                    with ProcessPoolExecutor(workers) as ex:
+            yield item
 
-                        results = list(ex.map(Article.process, chunk))
-                        results = [r for r in results if r is not None]
+    try:
 
-                        # Compute statistics.
+        with tqdm(total = total, desc = "Extracting Summaries") as progress:
+            with jsonl.open(archive) as archive_file:
+                with jsonl.open(dataset, threads = 0, index = True,
+                        shards = shards, **jsonl.formats[compression]) as dataset_file:
 
-                        for result in results:
+                    writes = queue.Queue(chunksize)
 
-                            if result["text"] is None or result["summary"] is None: continue
+                    def writer():
 
-                            fragments = Fragments(result["summary"], result["text"])
+                        while True:
 
-                            result["density"] = fragments.density()
-                            result["coverage"] = fragments.coverage()
-                            result["compression"] = fragments.compression()
+                            result = writes.get()
 
-                            result["compression"] = fragments.compression()
-                            result["coverage"] = fragments.coverage()
-                            result["density"] = fragments.density()
+                            if result is None:
 
-                            for measure in ("compression", "coverage", "density"):
+                                return
 
-                                result[measure + "_bin"] = binner(
-                                    result[measure],
-                                    cutoffs[measure],
-                                    levels[measure])
+                            try:
 
-                        dataset_file.append(results)
-                        progress.update(len(results))
+                                dataset_file.appendline(result)
 
-                for article in archive_file.readlines(ignore_errors = True):
+                            except Exception as e:
 
-                    url = article.get("archive", article.get("url"))
-                    if url not in todo: continue
+                                failed.append(e)
 
-                    chunk.append(article)
+                    thread = threading.Thread(target = writer, daemon = True)
+                    thread.start()
 
-                    if len(chunk) >= chunksize:
+                    try:
 
-                        process_chunk()
-                        chunk = []
+                        with Pool(workers, _init, (done,)) as pool:
+
+                            try:
+
+                                for results in pool.imap_unordered(
+                                        process, work(), per_task):
+
+                                    inflight.release()
+
+                                    if not ranges:
+
+                                        results = [results]
+
+                                    progress.update(len(results))
+
+                                    for result in results:
+
+                                        # (Ranges may repeat a page.)
+
+                                        if result is None \
+                                                or result["archive"] in done:
+
+                                            continue
+
+                                        unsummarized += result["summary"] is None
+                                        done.add(result["archive"])
+                                        writes.put(result)
+
+                                    if failed:
+
+                                        raise failed[0]
+
+                            finally:
+
+                                # Let the pool's feeder thread finish.
+
+                                stopped.set()
+                                inflight.release()
+
+                    finally:
+
+                        writes.put(None)
+                        thread.join()
+
+                    if failed:
+
+                        raise failed[0]
+
+    finally:
+
+        # Record what is finished, so the next run can skip it without
+        # reading the dataset (unless a write failed).
+
+        if os.path.exists(dataset) and not failed:
+
+            done.save(dataset)
+
+    if skip_unsummarized:
+
+        print("\nSkipped the text of", unsummarized, "pages without a summary.")
+
+    else:
 
-                process_chunk()
+        print("\n" + str(unsummarized), "pages had no summary.")
 
     print("\nExtraction complete.")
 
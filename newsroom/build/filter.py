@@ -1,13 +1,180 @@
-import re
+import copy, re
 
 from urllib.parse import quote, urlparse, urljoin
 from bs4 import BeautifulSoup
 from readability import Document
+from readability.htmls import build_doc
+from lxml import etree
+
+from .charset import page_html
 
 
 _whitespace = re.compile(r"\s+")
 
 
+# Readability's article tree can be read directly when re-parsing its HTML
+# would not change any paragraph: every <p> sits in one of these containers
+# and only holds inline elements. Otherwise (e.g., a <div> it turned into a
+# <p> that holds a heading), the parser would split the paragraph, so the
+# HTML is parsed again, as before.
+
+_containers = {
+    "html", "body", "div", "article", "section", "main", "header", "footer",
+    "aside", "blockquote", "center", "figure", "figcaption", "table",
+    "tbody", "thead", "tfoot", "tr", "td", "th", "ul", "ol", "li", "dl",
+    "dd",
+}
+
+_inline = {
+    "a", "abbr", "b", "bdi", "bdo", "big", "br", "cite", "code", "data",
+    "del", "dfn", "em", "font", "i", "img", "ins", "kbd", "mark", "q", "s",
+    "samp", "small", "span", "strike", "strong", "sub", "sup", "time", "tt",
+    "u", "var", "wbr",
+}
+
+
+def _reparses_same(tree):
+
+    for paragraph in tree.iter("p"):
+
+        parent = paragraph.getparent()
+
+        while parent is not None:
+
+            if parent.tag not in _containers:
+
+                return False
+
+            parent = parent.getparent()
+
+        for child in paragraph.iterdescendants():
+
+            if child.tag not in _inline:
+
+                return False
+
+    return True
+
+
+def _describes(attrs):
+
+    # Whether a <meta> tag gives a summary (see Article._extract_summary).
+
+    return "content" in attrs and any(
+        attr in ("name", "property") and "description" in value
+        for attr, value in attrs.items())
+
+
+_chunk = 2 ** 14
+
+
+def _may_describe(html):
+
+    """
+
+    Check cheaply whether a page may have a description <meta> tag, by
+    parsing it incrementally only until its <body> starts.
+
+    Returns False only if no tag in the head describes the page, and
+    "description" appears nowhere after it either.
+
+    """
+
+    if "description" not in html:
+
+        return False
+
+    parser = etree.HTMLPullParser(events = ("start",))
+    position = 0
+
+    try:
+
+        while position < len(html):
+
+            start = position
+            position += _chunk
+            parser.feed(html[start:position])
+
+            for _, element in parser.read_events():
+
+                if element.tag == "meta" and _describes(element.attrib):
+
+                    return True
+
+                if element.tag == "body":
+
+                    return "description" in html[start:]
+
+        parser.close()
+
+        for _, element in parser.read_events():
+
+            if element.tag == "meta" and _describes(element.attrib):
+
+                return True
+
+    except (etree.LxmlError, ValueError):
+
+        return True
+
+    return False
+
+
+class _summary(str):
+
+    # Readability's serialized article, along with its tree.
+
+    def __new__(cls, html, tree):
+
+        self = super().__new__(cls, html)
+        self.tree = tree
+
+        return self
+
+
+class _Readability(Document):
+
+    """
+
+    A readability Document working from a page that is already parsed.
+
+    Readability parses the page again every time it needs a fresh copy
+    (each summary attempt, and short_title). Here, the page is cleaned
+    once, and copies of the cleaned tree are handed out instead. The
+    summary also keeps its tree, so it need not be parsed again.
+
+    """
+
+    def __init__(self, html, tree):
+
+        super().__init__(html)
+
+        self._tree = tree
+        self._cleaned = None
+
+
+    def _parse(self, input):
+
+        if self._cleaned is None:
+
+            try:
+
+                self._cleaned = super()._parse(self._tree)
+
+            except (TypeError, AttributeError):
+
+                # Readability before 0.8.4 only parses strings.
+
+                self._cleaned = super()._parse(input)
+
+        return copy.deepcopy(self._cleaned)
+
+
+    def get_clean_html(self):
+
+        return _summary(super().get_clean_html(), self.html)
+
+
 class Article(object):
 
     """
@@ -17,12 +184,28 @@ class Article(object):
     that the provided URL in this case is actually the ARCHIVE url (Maybe this
     should be made clearer in the downloader script?).
 
+    By default, the page is parsed once with lxml, and that tree is shared
+    by readability and the summary and canonical URL lookups. With legacy
+    = True, the page is parsed separately for each (with BeautifulSoup for
+    the lookups), which gives the same results, only slower.
+
+    With skip_unsummarized = True, pages without a description (so with
+    a summary of None) are not run through readability, and their title
+    and text are None. self.skipped tells why: "head" if the start of the
+    page was enough to tell (see _may_describe), or "tree" if the whole
+    page had to be parsed.
+
     """
 
-    def __init__(self, archive, html):
+    def __init__(self, archive, html, legacy = False,
+            skip_unsummarized = False):
 
         self.archive = archive
         self.html    = html if html is not None else ""
+        self.legacy  = legacy
+
+        self.skip_unsummarized = skip_unsummarized
+        self.skipped = None
 
         self._parse_archive()
         self._parse_html()
@@ -40,19 +223,58 @@ class Article(object):
 
     def _parse_html(self):
 
+        if self.skip_unsummarized and not self.legacy \
+                and self.html.strip() != "" and not _may_describe(self.html):
+
+            self.original_url = self.url
+            self.all_summaries = {}
+            self.summary = None
+
+            self._skip("head")
+            return
+
         self._load_html()
         self._find_canonical_url()
 
-        self._extract_text()
+        # Summaries come first, as readability drops hidden elements from
+        # the shared tree.
+
         self._extract_summary()
 
+        if self.skip_unsummarized and self.summary is None:
+
+            self._skip("tree")
+            return
+
+        self._extract_text()
+
+
+    def _skip(self, reason):
+
+        # Without a summary, the page is useless: skip its text.
+
+        self.skipped = reason
+        self.title = None
+        self.text = None
+
+
+    def _meta_tags(self):
+
+        # Pairs of (tag, attributes) for each <meta> tag.
+
+        if self.legacy:
+
+            return ((meta, meta.attrs) for meta in self.soup.findAll("meta"))
+
+        return ((meta, meta.attrib) for meta in self.tree.iter("meta"))
+
 
     def _extract_summary(self):
 
         self.all_summaries = {}
 
-        for meta in self.soup.findAll("meta"):
-            for attr, value in meta.attrs.items():
+        for meta, attrs in self._meta_tags():
+            for attr, value in attrs.items():
 
                 if attr in ("name", "property") and "description" in value:
 
@@ -98,21 +320,31 @@ class Article(object):
         # its "summary." We want to create a plain text document from the body text,
         # so we need to extract the text from Readability's HTML version.
 
-        body_soup = BeautifulSoup(self.readability.summary(), "lxml")
+        summary = self.readability.summary()
+        tree = getattr(summary, "tree", None)
+
+        if tree is not None and _reparses_same(tree):
+
+            paragraphs = (p.text_content() for p in tree.iter("p"))
+
+        else:
+
+            body_soup = BeautifulSoup(summary, "lxml")
+            paragraphs = (p.text for p in body_soup.findAll("p"))
 
 
         # Now go through and extract each paragraph (in order).
 
         paragraph_text = []
-        for paragraph in body_soup.findAll("p"):
+        for paragraph in paragraphs:
 
             # Very short pieces of text tend not to be article body text, but
             # captions, attributions, and advertising. It seems that excluding
             # paragraphs shorter than five words removes most of this.
 
-            if len(paragraph.text.split()) >= 5:
+            if len(paragraph.split()) >= 5:
 
-                paragraph_body = _whitespace.sub(" ", paragraph.text).strip()
+                paragraph_body = _whitespace.sub(" ", paragraph).strip()
                 paragraph_text.append(paragraph_body)
 
 
@@ -140,8 +372,32 @@ class Article(object):
         # - A Readability parse object to extract the text
         # - A full-page BeautifulSoup object to extract summaries.
 
-        self.readability = Document(self.html)
-        self.soup = BeautifulSoup(self.html, "lxml")
+        if self.legacy:
+
+            self.readability = Document(self.html)
+            self.soup = BeautifulSoup(self.html, "lxml")
+
+            return
+
+        # Or parse the page once, and share the tree.
+
+        self.tree, _ = build_doc(self.html)
+        self.readability = _Readability(self.html, self.tree)
+
+
+    def _canonical_href(self):
+
+        if self.legacy:
+
+            return self.soup.find("link", {"rel": "canonical"}).get("href")
+
+        for link in self.tree.iter("link"):
+
+            if "canonical" in (link.get("rel") or "").split():
+
+                return link.get("href")
+
+        return None
 
 
     def _find_canonical_url(self):
@@ -157,7 +413,7 @@ class Article(object):
             # BeautifulSoup will raise an exception, and we will give up, sticking
             # with the normalized URL as the best URL.
 
-            rel_canon = self.soup.find("link", {"rel": "canonical"}).get("href")
+            rel_canon = self._canonical_href()
 
 
             # I've sometimes seen the canonical URL be relative to the current page.
@@ -204,14 +460,14 @@ class Article(object):
 
 
     @staticmethod
-    def process(page):
+    def process(page, skip_unsummarized = False):
 
         url = page.get("archive", page.get("url"))
-        html = page.get("html", "")
-        if html is None: html = ""
+        html = page_html(page)
 
         try:
-            return Article(url, html).serialize()
+            return Article(url, html,
+                skip_unsummarized = skip_unsummarized).serialize()
         except:
             return None
 
@@ -0,0 +1,430 @@
+import array  as _array
+import bisect as _bisect
+import bz2    as _bz2
+import lzma   as _lzma
+import os     as _os
+import zlib   as _zlib
+import ujson  as _json
+
+_open = open
+
+# Minimum compressed distance between recorded restart points.
+
+_span = 2 ** 20
+
+_chunk = 2 ** 20
+
+
+def _decompressor(kind):
+
+    if kind == "gzip":
+
+        return _zlib.decompressobj(31)
+
+    elif kind == "bzip":
+
+        return _bz2.BZ2Decompressor()
+
+    else:
+
+        return _lzma.LZMADecompressor()
+
+
+def inflate(f, kind, offset = 0):
+
+    """
+
+    Decompress a (possibly multi-member) file from a raw byte offset.
+
+    Arguments:
+
+        f (file) - binary file object opened for reading
+        kind (str) - one of "gzip", "bzip" or "xz"
+        offset (int) - raw offset where a compressed member begins
+
+    Yields:
+
+        (offset, b"") when a new compressed member begins, and
+        (None, data) for each block of decompressed data
+
+    """
+
+    f.seek(offset)
+
+    position = offset
+    raw = f.read(_chunk)
+    decompressor = None
+
+    while raw:
+
+        if decompressor is None:
+
+            decompressor = _decompressor(kind)
+            yield position, b""
+
+        data = decompressor.decompress(raw)
+
+        if data:
+
+            yield None, data
+
+        if decompressor.eof:
+
+            rest = decompressor.unused_data
+            position += len(raw) - len(rest)
+            decompressor = None
+            raw = rest or f.read(_chunk)
+
+        else:
+
+            position += len(raw)
+            raw = f.read(_chunk)
+
+
+class Index(object):
+
+    """
+
+    Sidecar index of a JSON lines file, stored at "<path>.idx".
+
+    Records the number of lines and a set of seek points, so that the
+    length is known without decompressing the file, and any range of
+    lines can be read by starting near it:
+
+        - uncompressed files store the byte offset of every line
+        - compressed files store (offset, line) restart points at the
+          start of compressed members, roughly every megabyte
+
+    Compressed files written by jsonl.open have a member per appended
+    line, or per batch when buffered, so restart points are plentiful.
+    Files that are a single compressed stream only get one point.
+
+    The index remembers the size and modification time of the data
+    file, and is treated as stale if either changes.
+
+    Arguments:
+
+        path (str) - path of the JSON lines data file
+        kind (str) - "gzip", "bzip", "xz" or None for uncompressed
+
+    """
+
+    def __init__(self, path, kind = None):
+
+        self.path    = path
+        self.kind    = kind
+        self.sidecar = path + ".idx"
+
+        self.count   = 0
+        self.points  = _array.array("q")
+        self.offsets = _array.array("q")
+
+        self.dirty   = False
+
+        self._last   = None
+        self._stamp  = None
+
+
+    def stamp(self):
+
+        """
+
+        Return the (size, mtime) pair used to detect a stale index.
+
+        """
+
+        try:
+
+            stat = _os.stat(self.path)
+            return [stat.st_size, stat.st_mtime_ns]
+
+        except FileNotFoundError:
+
+            return [0, 0]
+
+
+    def fresh(self):
+
+        """
+
+        Check whether the index still matches the data file on disk.
+
+        """
+
+        return self._stamp == self.stamp()
+
+
+    def load(self):
+
+        """
+
+        Load the sidecar from disk.
+
+        Returns:
+
+            True if the sidecar exists and matches the data file
+
+        """
+
+        try:
+
+            with _open(self.sidecar, "rb") as f:
+
+                header = _json.loads(f.readline())
+                body = f.read()
+
+        except (OSError, ValueError):
+
+            return False
+
+        if header.get("version") != 1 \
+                or header.get("kind") != self.kind \
+                or header.get("stamp") != self.stamp():
+
+            return False
+
+        values = _array.array("q")
+        values.frombytes(body)
+
+        self.count = header["count"]
+        self.dirty = False
+        self._stamp = header["stamp"]
+
+        if self.kind is None:
+
+            self.offsets = values
+
+        else:
+
+            self.points = values
+            self._last = values[-2] if values else None
+
+        return True
+
+
+    def save(self):
+
+        """
+
+        Write the sidecar to disk. If it cannot be written (e.g., the data
+        file is in a read-only directory), the index is only kept in memory.
+
+        Returns:
+
+            True if the sidecar was written
+
+        """
+
+        self._stamp = self.stamp()
+        self.dirty = False
+
+        header = {
+            "version": 1,
+            "kind":    self.kind,
+            "count":   self.count,
+            "stamp":   self._stamp,
+        }
+
+        values = self.offsets if self.kind is None else self.points
+
+        tmp = self.sidecar + ".tmp"
+
+        try:
+
+            with _open(tmp, "wb") as f:
+
+                f.write((_json.dumps(header) + "\n").encode("utf-8"))
+                f.write(values.tobytes())
+
+            _os.replace(tmp, self.sidecar)
+
+        except OSError:
+
+            try:
+
+                _os.remove(tmp)
+
+            except OSError:
+
+                pass
+
+            return False
+
+        return True
+
+
+    def reset(self):
+
+        """
+
+        Forget all lines (e.g., after truncating the data file).
+
+        """
+
+        self.count = 0
+        self.points = _array.array("q")
+        self.offsets = _array.array("q")
+        self.dirty = False
+        self._last = None
+
+
+    def build(self):
+
+        """
+
+        Scan the data file to rebuild the index from scratch.
+
+        """
+
+        self.reset()
+        self._stamp = self.stamp()
+
+        if not _os.path.isfile(self.path):
+
+            return self
+
+        with _open(self.path, "rb") as f:
+
+            if self.kind is None:
+
+                position = 0
+
+                for line in f:
+
+                    self.offsets.append(position)
+                    position += len(line)
+
+                self.count = len(self.offsets)
+
+            else:
+
+                tail = b"\n"
+
+                for member, data in inflate(f, self.kind):
+
+                    if member is not None:
+
+                        if tail == b"\n":
+
+                            self._point(member)
+
+                        continue
+
+                    self.count += data.count(b"\n")
+                    tail = data[-1:]
+
+                if tail != b"\n":
+
+                    self.count += 1
+
+        return self
+
+
+    def _point(self, offset):
+
+        # Record a restart point if it is far enough from the last one.
+
+        if self._last is None or offset - self._last >= _span:
+
+            self.points.extend([offset, self.count])
+            self._last = offset
+
+
+    def extend(self, offset, lengths):
+
+        """
+
+        Record lines that were just appended to the data file.
+
+        Arguments:
+
+            offset (int) - raw offset where the appended bytes begin,
+                           if they begin a new compressed member
+            lengths (list[int]) - byte length of each appended line
+
+        """
+
+        if self.kind is None:
+
+            for length in lengths:
+
+                self.offsets.append(offset)
+                offset += length
+
+        elif offset is not None:
+
+            self._point(offset)
+
+        self.count += len(lengths)
+        self.dirty = True
+
+
+    def lines(self, start, stop):
+
+        """
+
+        Read a range of raw lines from the data file.
+
+        Arguments:
+
+            start (int) - index of the first line
+            stop (int) - index after the last line
+
+        Yields:
+
+            each line as bytes (including the trailing newline)
+
+        """
+
+        stop = min(stop, self.count)
+
+        if start >= stop:
+
+            return
+
+        with _open(self.path, "rb") as f:
+
+            if self.kind is None:
+
+                f.seek(self.offsets[start])
+
+                for _ in range(stop - start):
+
+                    yield f.readline()
+
+                return
+
+            # Find the closest restart point before the first line.
+
+            records = self.points[1::2]
+            p = max(_bisect.bisect_right(records, start) - 1, 0)
+
+            offset, line = (self.points[2 * p], records[p]) \
+                if records else (0, 0)
+
+            partial = b""
+
+            for member, data in inflate(f, self.kind, offset):
+
+                if member is not None:
+
+                    continue
+
+                chunk = (partial + data).split(b"\n")
+                partial = chunk.pop()
+
+                for raw in chunk:
+
+                    if line >= start:
+
+                        yield raw + b"\n"
+
+                    line += 1
+
+                    if line >= stop:
+
+                        return
+
+            if partial and line >= start:
+
+                yield partial
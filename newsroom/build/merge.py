@@ -0,0 +1,315 @@
+################################################################################
+
+import click, glob, os, re
+
+from newsroom import jsonl
+
+from .urlset import URLSet
+
+################################################################################
+
+def shard_path(archive, i, n):
+
+    """
+
+    Path of shard i of n of an archive scraped with --shard i/n.
+
+    """
+
+    return f"{archive.rstrip('/')}.{i}-of-{n}"
+
+
+def parse_shard(ctx, param, value):
+
+    """
+
+    Parse a "--shard i/n" option into (i, n), with 0 <= i < n.
+
+    """
+
+    if value is None:
+
+        return None
+
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", value)
+
+    if not match or not int(match.group(1)) < int(match.group(2)):
+
+        raise click.BadParameter("expected i/n with 0 <= i < n, e.g. 0/4")
+
+    return int(match.group(1)), int(match.group(2))
+
+
+def find_shards(archive):
+
+    """
+
+    Find the shards of an archive.
+
+    Returns:
+
+        (n, {i: path}) for the shards found, or (None, {}) if none are
+
+    Raises:
+
+        ValueError if shards with different counts are found
+
+    """
+
+    pattern = re.compile(re.escape(archive.rstrip("/")) + r"\.(\d+)-of-(\d+)")
+    found = {}
+    counts = set()
+
+    for path in glob.glob(glob.escape(archive.rstrip("/")) + ".*-of-*"):
+
+        match = pattern.fullmatch(path)
+
+        if match:
+
+            i, n = int(match.group(1)), int(match.group(2))
+            found[i] = path
+            counts.add(n)
+
+    if len(counts) > 1:
+
+        raise ValueError("shards of different counts: " + str(sorted(counts)))
+
+    return (counts.pop() if counts else None), found
+
+################################################################################
+
+archive_file = click.Path(
+    dir_okay     = True,
+    writable     = True,
+    resolve_path = True,
+)
+
+urls_file = click.Path(
+    exists       = True,
+    dir_okay     = False,
+    readable     = True,
+    resolve_path = True,
+)
+
+################################################################################
+
+@click.command()
+
+@click.option(
+    "--archive",
+    type = archive_file,
+    required = True,
+    help = "Archive path given to newsroom-scrape --shard (shards are <archive>.I-of-N).",
+)
+
+@click.option(
+    "--output",
+    type = archive_file,
+    default = None,
+    help = "Output path for the merged archive. [default = --archive]",
+)
+
+@click.option(
+    "--urls",
+    type = urls_file,
+    default = None,
+    help = "URL file scraped, to check that every URL was downloaded.",
+)
+
+@click.option(
+    "--thin",
+    type = urls_file,
+    default = None,
+    help = "Thin dataset scraped, to check that every URL was downloaded.",
+)
+
+@click.option(
+    "--check",
+    is_flag = True,
+    help = "Only check shards for completeness and duplicates. [default = off]",
+)
+
+@click.option(
+    "--batch-size",
+    type = int,
+    default = 2 ** 12,
+    help = "Entries read and written at a time. [default = 4096]",
+)
+
+@click.option(
+    "--format",
+    "compression",
+    type = click.Choice(list(jsonl.formats)),
+    default = "gzip",
+    help = "Compression of the merged archive. [default = gzip]",
+)
+
+@click.option(
+    "--iostats",
+    is_flag = True,
+    help = "Print per-file I/O statistics on exit. [default = off]",
+)
+
+################################################################################
+
+def main(archive, output, urls, thin, check, batch_size, compression, iostats):
+
+    if iostats:
+
+        jsonl.profile()
+
+    output = output or archive
+
+    try:
+
+        n, shards = find_shards(archive)
+
+    except ValueError as e:
+
+        print("Cannot merge:", e)
+        return
+
+    if n is None:
+
+        print("No shards found for", archive)
+        return
+
+    absent = [i for i in range(n) if i not in shards]
+
+    if absent:
+
+        print("Cannot merge: missing shards", absent, "of", n)
+        return
+
+    if not check and os.path.exists(output):
+
+        print("Cannot merge: output", output, "already exists.")
+        return
+
+    if check:
+
+        print("Checking", n, "shards of", archive)
+
+    else:
+
+        print("Merging", n, "shards into", output)
+
+    # Every URL is kept once, and should be in the shard it hashes to.
+
+    seen = URLSet()
+    entries = duplicates = misplaced = 0
+
+    out = None if check else jsonl.open(output, buffer = 2 ** 22,
+        index = True, **jsonl.formats[compression])
+
+    try:
+
+        for i in range(n):
+
+            with jsonl.open(shards[i]) as f:
+
+                fields = ["archive", "url"] if check else None
+
+                for batch in f.readlines(ignore_errors = True,
+                        batch_size = batch_size, fields = fields):
+
+                    kept = []
+
+                    for entry in batch:
+
+                        url = entry.get("archive", entry.get("url"))
+
+                        if url in seen:
+
+                            duplicates += 1
+                            continue
+
+                        if jsonl.shard(url, n) != i:
+
+                            misplaced += 1
+
+                        seen.add(url)
+                        kept.append(entry)
+
+                    entries += len(kept)
+
+                    if out is not None:
+
+                        out.append(kept)
+
+            print("- shard", i, "done,", entries, "entries so far")
+
+    finally:
+
+        if out is not None:
+
+            out.close()
+
+    if out is not None:
+
+        seen.save(output)
+
+        # Carry over CDX resolutions, so that --resolve does not repeat
+        # them, and the reports of skipped pages.
+
+        for suffix in (".cdx", ".skipped"):
+
+            found = [shards[i] + suffix for i in range(n)
+                     if os.path.exists(shards[i] + suffix)]
+
+            if found:
+
+                with jsonl.open(output.rstrip("/") + suffix) as f:
+
+                    for path in found:
+
+                        with jsonl.open(path) as shard_file:
+
+                            f.append(shard_file.readlines(ignore_errors = True))
+
+    print("\n" + str(entries), "entries,", duplicates, "duplicates dropped.")
+
+    if misplaced:
+
+        print(misplaced, "entries were not in the shard their URL hashes to",
+              "(was --shard used with a different list?).")
+
+    # Check that every URL was downloaded, and say which shards to re-run.
+
+    if urls or thin:
+
+        if urls:
+
+            with open(urls, "r") as f:
+
+                expected = [ln.strip() for ln in f if ln.strip()]
+
+        else:
+
+            with jsonl.open(thin) as f:
+
+                expected = [entry["archive"] for entry in
+                            f.readlines(fields = ["archive"])]
+
+        missing = seen.missing(expected)
+
+        if missing:
+
+            counts = {}
+
+            for url in missing:
+
+                i = jsonl.shard(url, n)
+                counts[i] = counts.get(i, 0) + 1
+
+            print(len(missing), "URLs missing. Re-run these shards:")
+
+            for i in sorted(counts):
+
+                print(f"- --shard {i}/{n}: {counts[i]} missing")
+
+        else:
+
+            print("All", len(expected), "URLs downloaded.")
+
+################################################################################
@@ -0,0 +1,197 @@
+import time, threading, asyncio
+
+from email.utils import parsedate_to_datetime
+
+
+def retry_after(value, now = None):
+
+    """
+
+    Parse a Retry-After header (seconds or an HTTP date) into seconds.
+
+    Returns None if the header is missing or malformed.
+
+    """
+
+    if not value:
+
+        return None
+
+    try:
+
+        return max(0.0, float(value))
+
+    except ValueError:
+
+        pass
+
+    try:
+
+        date = parsedate_to_datetime(value)
+
+    except (TypeError, ValueError, IndexError):
+
+        return None
+
+    return max(0.0, date.timestamp() - (now or time.time()))
+
+
+class RateLimiter(object):
+
+    def __init__(
+
+            self,
+            rate,
+            increase = 1.0,
+            multiplier = 1.5,
+            minimum = 0.1,
+            maximum = None,
+            burst = 1,
+            cooldown = 1.0,
+
+            ):
+
+        """
+
+        Token bucket shared by every download worker, with the rate
+        adjusted by additive increase and multiplicative decrease (AIMD).
+
+        Each success raises the rate so that it grows by about "increase"
+        requests per second every second. A throttled response (429 or
+        503) or a timeout divides the rate by "multiplier", at most once
+        per "cooldown" seconds, since a burst of throttled responses is
+        usually one event. A Retry-After header also pauses all workers.
+
+        Arguments:
+
+            - rate: initial requests per second
+            - increase: additive increase per second (default = 1.0)
+            - multiplier: divide the rate on throttling (default = 1.5)
+            - minimum: lowest rate in requests per second (default = 0.1)
+            - maximum: highest rate, or None for no cap (default = None)
+            - burst: tokens that can accumulate while idle (default = 1)
+            - cooldown: seconds between decreases (default = 1.0)
+
+        Example:
+
+            >>> limiter = RateLimiter(8)
+            >>> limiter.wait()       # before each request
+            >>> limiter.success()    # or limiter.throttled(retry_after)
+
+        """
+
+        self.increase = increase
+        self.multiplier = multiplier
+        self.minimum = minimum
+        self.maximum = maximum
+        self.burst = burst
+        self.cooldown = cooldown
+
+        self.rate = self._clamp(rate)
+
+        self.successes = 0
+        self.throttles = 0
+
+        self._lock = threading.Lock()
+        self._next = 0.0
+        self._paused = 0.0
+        self._decreased = 0.0
+
+
+    def _clamp(self, rate):
+
+        rate = max(self.minimum, rate)
+
+        if self.maximum is not None:
+
+            rate = min(self.maximum, rate)
+
+        return rate
+
+
+    def delay(self):
+
+        """
+
+        Seconds until the next token is free, without reserving it.
+
+        """
+
+        with self._lock:
+
+            now = time.monotonic()
+
+            slot = max(self._next, self._paused,
+                now - (self.burst - 1) / self.rate)
+
+            return max(0.0, slot - now)
+
+
+    def reserve(self):
+
+        """
+
+        Reserve the next token.
+
+        Returns:
+
+            seconds to wait before sending the request
+
+        """
+
+        with self._lock:
+
+            now = time.monotonic()
+
+            slot = max(self._next, self._paused,
+                now - (self.burst - 1) / self.rate)
+
+            self._next = slot + 1 / self.rate
+
+            return max(0.0, slot - now)
+
+
+    def wait(self):
+
+        time.sleep(self.reserve())
+
+
+    async def wait_async(self):
+
+        await asyncio.sleep(self.reserve())
+
+
+    def success(self):
+
+        with self._lock:
+
+            self.successes += 1
+            self.rate = self._clamp(self.rate + self.increase / self.rate)
+
+
+    def throttled(self, retry_after = None):
+
+        """
+
+        Record a throttled response or timeout.
+
+        Arguments:
+
+            - retry_after: seconds the server asked to wait (default = None)
+
+        """
+
+        with self._lock:
+
+            now = time.monotonic()
+
+            self.throttles += 1
+
+            if retry_after:
+
+                self._paused = max(self._paused, now + retry_after)
+
+            if now - self._decreased >= self.cooldown:
+
+                self.rate = self._clamp(self.rate / self.multiplier)
+                self._decreased = now
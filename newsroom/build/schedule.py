@@ -0,0 +1,254 @@
+import threading
+
+from collections import deque
+from urllib.parse import urlsplit
+
+from .ratelimit import RateLimiter
+
+
+class Job(object):
+
+    __slots__ = ("index", "url", "host", "attempts")
+
+    def __init__(self, index, url, host):
+
+        self.index = index
+        self.url = url
+        self.host = host
+        self.attempts = 0
+
+
+class _Host(object):
+
+    __slots__ = ("queue", "limiter", "inflight")
+
+    def __init__(self, limiter):
+
+        self.queue = deque()
+        self.limiter = limiter
+        self.inflight = 0
+
+
+class Scheduler(object):
+
+    def __init__(
+
+            self,
+            per_host = 4,
+            rate = None,
+            multiplier = 1.5,
+            maximum = None,
+
+            ):
+
+        """
+
+        Hand out download jobs across hosts, so that one slow or throttled
+        host does not hold up the others.
+
+        Every host has its own queue, concurrency limit and adaptive rate
+        limit (see RateLimiter). Workers take the next job from the hosts
+        that are ready (below their limit, with a free token) in round
+        robin order, and only wait when no host is ready.
+
+        Arguments:
+
+            - per_host: max concurrent requests per host (default = 4)
+            - rate: initial requests per second per host, or None for
+              no rate limit (default = None)
+            - multiplier: divide a host's rate when throttled (default = 1.5)
+            - maximum: cap on each host's rate (default = None)
+
+        Example:
+
+            >>> scheduler = Scheduler(per_host = 2, rate = 1)
+            >>> scheduler.add(0, "http://a.com/x")
+            >>> job = scheduler.take()
+            >>> scheduler.finish(job)
+
+        """
+
+        self.per_host = per_host
+        self.rate = rate
+        self.multiplier = multiplier
+        self.maximum = maximum
+
+        self.hosts = {}
+
+        self._ready = deque()
+        self._inflight = 0
+        self._closed = False
+        self._stopped = False
+        self._changed = threading.Condition()
+
+
+    def limiter(self, host):
+
+        """
+
+        The rate limiter of a host (None if rates are not limited).
+
+        """
+
+        return self.hosts[host].limiter
+
+
+    def add(self, index, url):
+
+        """
+
+        Queue a URL (with its position in the input) for download.
+
+        """
+
+        host = urlsplit(url).netloc
+
+        with self._changed:
+
+            state = self.hosts.get(host)
+
+            if state is None:
+
+                state = self.hosts[host] = _Host(RateLimiter(
+                    self.rate,
+                    multiplier = self.multiplier,
+                    maximum = self.maximum) if self.rate else None)
+
+            if not state.queue:
+
+                self._ready.append(host)
+
+            state.queue.append(Job(index, url, host))
+            self._changed.notify()
+
+
+    def close(self):
+
+        """
+
+        No more URLs will be added: take() returns None once all are done.
+
+        """
+
+        with self._changed:
+
+            self._closed = True
+            self._changed.notify_all()
+
+
+    def stop(self):
+
+        """
+
+        Drop queued jobs and make every take() return None.
+
+        """
+
+        with self._changed:
+
+            self._closed = True
+            self._stopped = True
+            self._changed.notify_all()
+
+
+    def _poll(self):
+
+        # Find a job from the next ready host, or how long to wait for
+        # a host's token (None to wait for a change).
+
+        delay = None
+
+        for _ in range(len(self._ready)):
+
+            host = self._ready[0]
+            self._ready.rotate(-1)
+
+            state = self.hosts[host]
+
+            if state.inflight >= self.per_host:
+
+                continue
+
+            if state.limiter:
+
+                wait = state.limiter.delay()
+
+                if wait > 0:
+
+                    delay = wait if delay is None else min(delay, wait)
+                    continue
+
+                state.limiter.reserve()
+
+            job = state.queue.popleft()
+
+            if not state.queue:
+
+                self._ready.remove(host)
+
+            state.inflight += 1
+            self._inflight += 1
+
+            return job, None
+
+        return None, delay
+
+
+    def take(self):
+
+        """
+
+        Wait for the next job to download.
+
+        Returns:
+
+            a Job, or None when closed and every job is finished
+
+        """
+
+        with self._changed:
+
+            while not self._stopped:
+
+                job, delay = self._poll()
+
+                if job is not None:
+
+                    return job
+
+                if self._closed and not self._ready and not self._inflight:
+
+                    return None
+
+                self._changed.wait(delay)
+
+            return None
+
+
+    def finish(self, job, retry = False):
+
+        """
+
+        Mark a job as finished, or queue it again (behind the other jobs
+        of its host) to retry it.
+
+        """
+
+        with self._changed:
+
+            state = self.hosts[job.host]
+
+            state.inflight -= 1
+            self._inflight -= 1
+
+            if retry:
+
+                job.attempts += 1
+
+                if not state.queue:
+
+                    self._ready.append(job.host)
+
+                state.queue.append(job)
+
+            self._changed.notify_all()
@@ -6,6 +6,10 @@ import os.path
 from tqdm import tqdm
 
 from . import Downloader
+from . import cdx
+from .cache import Cache
+from .urlset import URLSet
+from .merge import shard_path, parse_shard
 from newsroom import jsonl
 
 import random
@@ -35,7 +39,7 @@ urls_file = click.Path(
 )
 
 archive_file = click.Path(
-    dir_okay     = False,
+    dir_okay     = True,
     readable     = True,
     writable     = True,
     resolve_path = True,
@@ -75,7 +79,7 @@ archive_file = click.Path(
     "--workers",
     type = int,
     default = 16,
-    help = "Number of threads to use. [default = 16]",
+    help = "Number of threads (or async requests) to use. [default = 16]",
 )
 
 @click.option(
@@ -89,7 +93,7 @@ archive_file = click.Path(
     "--sleep",
     type = float,
     default = 2,
-    help = "Delay between downloading articles. [default = 2 sec]",
+    help = "Initial delay between downloads per worker. [default = 2 sec]",
 )
 
 @click.option(
@@ -99,36 +103,161 @@ archive_file = click.Path(
     help = "Archive.org rate limiting sensitivity. [default = 1.5]",
 )
 
+@click.option(
+    "--max-rate",
+    type = float,
+    default = None,
+    help = "Maximum downloads per second. [default = adaptive]",
+)
+
+@click.option(
+    "--engine",
+    type = click.Choice(["threads", "async"]),
+    default = "threads",
+    help = "Download with a thread pool, or asyncio. [default = threads]",
+)
+
+@click.option(
+    "--connections",
+    type = int,
+    default = None,
+    help = "Max keep-alive connections (async engine). [default = workers]",
+)
+
+@click.option(
+    "--max-size",
+    type = float,
+    default = 10,
+    help = "Skip pages larger than this many MB (0 for no limit). [default = 10]",
+)
+
+@click.option(
+    "--content-types",
+    type = str,
+    default = "text/html,application/xhtml+xml",
+    help = "Only download these types (\"\" for any). [default = HTML]",
+)
+
+@click.option(
+    "--compress/--no-compress",
+    default = True,
+    help = "Request compressed transfers. [default = on]",
+)
+
+@click.option(
+    "--inflight",
+    type = int,
+    default = None,
+    help = "Max pages downloading or waiting to be saved. [default = 2*workers]",
+)
+
+@click.option(
+    "--per-host",
+    type = int,
+    default = None,
+    help = "Max concurrent downloads per host, with a rate limit per host. [default = off]",
+)
+
+@click.option(
+    "--cache",
+    "cache_path",
+    type = click.Path(file_okay = False),
+    default = None,
+    help = "Directory caching downloaded pages for later scrapes. [default = off]",
+)
+
+@click.option(
+    "--cache-size",
+    type = float,
+    default = 10,
+    help = "Cache size budget in GB, dropping least recently used pages. [default = 10]",
+)
+
+@click.option(
+    "--resolve",
+    is_flag = True,
+    help = "Find nearest captures of failed URLs with the CDX API. [default = off]",
+)
+
+@click.option(
+    "--cdx",
+    "cdx_endpoint",
+    type = str,
+    default = cdx.endpoint,
+    help = "CDX API endpoint for --resolve. [default = web.archive.org]",
+)
+
 @click.option(
     "--diff",
     is_flag = True,
     help = "Check remaining URLs to download. [default = off]",
 )
 
+@click.option(
+    "--shard",
+    type = str,
+    default = None,
+    callback = parse_shard,
+    help = "Scrape only shard I/N of the URLs, into <archive>.I-of-N (see newsroom-merge). [default = off]",
+)
+
+@click.option(
+    "--shards",
+    type = int,
+    default = None,
+    help = "Write a new archive as a directory of shards. [default = off]",
+)
+
+@click.option(
+    "--format",
+    "compression",
+    type = click.Choice(list(jsonl.formats)),
+    default = "gzip",
+    help = "Compression of a new archive. [default = gzip]",
+)
+
+@click.option(
+    "--iostats",
+    is_flag = True,
+    help = "Print per-file I/O statistics on exit. [default = off]",
+)
+
 ################################################################################
 
-def main(urls, thin, archive, exactness, diff, **downloader_args):
+def main(urls, thin, archive, exactness, diff, shard, shards, compression,
+        iostats, resolve, cdx_endpoint, cache_path, cache_size,
+        **downloader_args):
+
+    if iostats:
+
+        jsonl.profile()
 
     if not urls and not thin:
 
         print("Either --urls or --thin must be defined.")
         return
 
+    # Each node scrapes its own shard into its own archive (with its own
+    # resume state), to be combined later with newsroom-merge.
+
+    if shard is not None:
+
+        archive = shard_path(archive, *shard)
+
     # If the archive file exists, only download what we need.
-    # Open the file and read all previously downloaded URLs.
+    # Previously downloaded URLs are kept in a compact sidecar, which is
+    # only rebuilt from the archive if it is missing or out of date.
 
-    if not os.path.isfile(archive):
+    if not os.path.exists(archive):
 
-        done = {}
+        done = URLSet()
 
     else:
 
         print("Loading previously downloaded summaries:", end = " ")
 
-        with jsonl.open(archive, gzip = True) as f:
-
-            done = {ln["archive"] for ln in f}
-            print(len(done), "downloaded summaries...", end = " ")
+        done = URLSet.load(archive)
+        print(len(done), "downloaded summaries...", end = " ")
 
     # Read the URL file or thin.
 
@@ -140,13 +269,24 @@ def main(urls, thin, archive, exactness, diff, **downloader_args):
 
     elif thin:
 
-        with jsonl.open(thin, gzip = True) as f:
+        with jsonl.open(thin) as f:
 
-            urls = [entry["archive"] for entry in f]
+            urls = [entry["archive"] for entry in f.readlines(fields = ["archive"])]
+
+    # Partition URLs by hash, so every node agrees on who gets which.
+
+    if shard is not None:
+
+        i, n = shard
+        total = len(urls)
+        urls = [url for url in urls if jsonl.shard(url, n) == i]
+
+        print(f"shard {i}/{n} has", len(urls), "of", total, "URLs,", end = " ")
 
     # Which URLs are remaining?
 
-    todo = [url for url in urls if url not in done]
+    todo = done.missing(urls)
+    wanted = todo
     size = round(0.00002 * len(todo), 1)
 
     # If --diff argument is enabled, just print undownloaded article URLs.
@@ -164,6 +304,11 @@ def main(urls, thin, archive, exactness, diff, **downloader_args):
 
         print(len(todo), "new summaries (about", size, "GB).")
 
+    if resolve and exactness is not None:
+
+        print("Use either --resolve or --exactness, not both.")
+        return
+
     # Truncate url dates if they can't be downloaded.
 
     if exactness is not None:
@@ -171,6 +316,36 @@ def main(urls, thin, archive, exactness, diff, **downloader_args):
         exactness_map = {_exactness(url, exactness): url for url in todo}
         todo = list(exactness_map.keys())
 
+    # Download captures found with the CDX API on earlier runs directly.
+    # Resolutions are cached next to the archive (see cdx.Resolver).
+
+    snapshots = {}
+
+    if resolve:
+
+        resolver = cdx.Resolver(
+            archive.rstrip("/") + ".cdx",
+            endpoint = cdx_endpoint)
+
+        # Several URLs may resolve to the same capture, which is then
+        # downloaded once and saved under each of them.
+
+        requested = set(todo)
+
+        for url in todo:
+
+            snapshot = resolver.get(url)
+
+            if snapshot not in (None, url):
+
+                if snapshot in requested and snapshot not in snapshots:
+
+                    snapshots[snapshot] = [snapshot]
+
+                snapshots.setdefault(snapshot, []).append(url)
+
+        todo = list(dict.fromkeys(resolver.get(url) or url for url in todo))
+
     # Randomize todo to prevent "hard" pages from collecting at start.
 
     random.shuffle(todo)
@@ -179,8 +354,64 @@ def main(urls, thin, archive, exactness, diff, **downloader_args):
 
     print("If pages fail to download now, re-run script when finished.\n")
 
-    scraper = Downloader(**downloader_args)
-    downloads = scraper.download(todo)
+    inflight = downloader_args.pop("inflight")
+    max_size = downloader_args.pop("max_size")
+    content_types = downloader_args.pop("content_types")
+
+    # Pages cached by earlier scrapes are used instead of downloading.
+
+    cache = Cache(cache_path, size = int(cache_size * 2 ** 30)) \
+        if cache_path else None
+
+    scraper = Downloader(
+        max_size = int(max_size * 2 ** 20) if max_size else None,
+        content_types = content_types.split(",") if content_types else None,
+        cache = cache,
+        **downloader_args)
+
+    saved = set()
+
+    def downloads():
+
+        # Save pages as they finish, with a bounded number in memory.
+
+        yield from scraper.download(iter(todo), ordered = False,
+            inflight = inflight)
+
+        if not resolve:
+
+            return
+
+        # Look up the nearest real capture of the pages that failed.
+
+        failed = [original for url in todo if url not in saved
+                  for original in snapshots.get(url, [url])]
+
+        if not failed:
+
+            return
+
+        print("\n\nResolving", len(failed), "failed URLs with the CDX API...")
+
+        resolved = resolver.resolve(failed)
+        retry = {}
+
+        # A capture that was already downloaded under another URL is
+        # downloaded again, to save it under these URLs too.
+
+        for url, snapshot in resolved.items():
+
+            if snapshot is not None:
+
+                retry.setdefault(snapshot, []).append(url)
+
+        print("Found", len(retry), "other captures, downloading...\n")
+
+        snapshots.update(retry)
+        progress.total += len(retry)
+
+        yield from scraper.download(iter(retry), ordered = False,
+            inflight = inflight)
 
     # Progress bar arguments.
 
@@ -193,13 +424,17 @@ def main(urls, thin, archive, exactness, diff, **downloader_args):
     # (We checked earlier, so we won't overwrite older downloads.)
 
     errors = 0
+    skipped = []
+    report = archive.rstrip("/") + ".skipped"
     progress.update(0)
 
     try:
 
-        with jsonl.open(archive, gzip = True) as f:
+        with jsonl.open(archive, buffer = 2 ** 22, interval = 30,
+                index = True, shards = shards,
+                **jsonl.formats[compression]) as f:
 
-            for article in downloads:
+            for article in downloads():
 
                 if article is None:
 
@@ -212,10 +447,14 @@ def main(urls, thin, archive, exactness, diff, **downloader_args):
 
                 else:
 
-                    # Rename url -> archive for consistency.
+                    # Rename url -> archive for consistency. It is written
+                    # first, so that readers only looking for it (resumes,
+                    # --diff) can stop before the HTML.
+
+                    saved.add(article["url"])
 
-                    article["archive"] = article["url"]
-                    del article["url"]
+                    article = {"archive": article.pop("url"), **article}
+                    articles = [article]
 
                     # Keep track of how much this article was truncated.
 
@@ -228,17 +467,65 @@ def main(urls, thin, archive, exactness, diff, **downloader_args):
                         article["exactness_archive"] = exactness_archive
                         article["archive"] = real_archive
 
-                    # Write updated dictionary to JSON file.
+                    # Or which capture was downloaded instead (once for
+                    # every URL that resolved to it).
+
+                    elif article["archive"] in snapshots:
+
+                        snapshot = article["archive"]
+
+                        articles = [
+                            dict(article, archive = url, snapshot = snapshot)
+                            if url != snapshot else article
+                            for url in snapshots[snapshot]]
+
+                    for article in articles:
+
+                        # Skipped pages (not HTML, or too large) are
+                        # reported apart from the archive, so that later
+                        # runs (perhaps with other limits) try them again.
+
+                        if "skipped" in article:
+
+                            skipped.append(article)
+
+                        # Write updated dictionary to JSON file.
+
+                        else:
 
-                    f.appendline(article)
+                            f.appendline(article)
+                            done.add(article["archive"])
 
                 progress.update(1)
 
+                if scraper.limiter:
+
+                    progress.set_postfix(
+                        rate = "%.1f/s" % scraper.rate(), refresh = False)
+
+        if skipped:
+
+            print("\n\nSkipped", len(skipped), "pages that are not HTML or "
+                  "too large (listed in " + report + ").")
+
+        if cache is not None:
+
+            print("\n\nServed", cache.hits, "pages from the cache.")
+
+        # (Count the requested URLs, as captures may stand in for several.)
+
+        errors = len(done.missing(wanted))
+
         if errors > 0:
 
             print("\n\nRerun the script:", errors, "pages failed to download.")
             print("- Try running with a lower --workers count (default = 16).")
             print("- Check which URLs are left with the --diff flag.")
+
+            if not resolve:
+
+                print("- Find the nearest captures with --resolve.")
+
             print("- Last resort: --exactness X to truncate dates to X digits.")
             print("  (e.g., --exactness 4 will download the closest year.)")
 
@@ -251,5 +538,17 @@ def main(urls, thin, archive, exactness, diff, **downloader_args):
         print("\n\nDownload aborted with progress preserved.")
         print("Run script again to resume from this point.")
 
+    finally:
+
+        if os.path.exists(archive):
+
+            done.save(archive)
+
+        if skipped or os.path.exists(report):
+
+            with jsonl.open(report) as f:
+
+                f.write(skipped)
+
 ################################################################################
 
@@ -0,0 +1,290 @@
+import os, json, struct, hashlib
+import numpy as np
+
+from array import array
+from bisect import bisect_left
+from heapq import merge
+
+from . import jsonl
+
+
+# Header: magic, size of the archive when saved, and number of hashes.
+
+_magic = b"NRURLS01"
+_header = struct.Struct("<8sQQ")
+
+
+def fingerprint(url):
+
+    """
+
+    64-bit hash of a URL.
+
+    """
+
+    digest = hashlib.blake2b(url.encode("utf-8"), digest_size = 8).digest()
+
+    return int.from_bytes(digest, "little")
+
+
+def sidecar(path):
+
+    """
+
+    Path of the URL set kept next to an archive or dataset.
+
+    """
+
+    return path.rstrip("/") + ".done"
+
+
+def _size(path):
+
+    # Total bytes of a file, or of the shards of a sharded directory (not
+    # their indexes, which may be rebuilt without changing the data).
+
+    if not os.path.isdir(path):
+
+        return os.path.getsize(path)
+
+    with open(os.path.join(path, jsonl.sharded.manifest_name), "r") as f:
+
+        names = json.load(f)["shards"]
+
+    total = 0
+
+    for name in names:
+
+        shard = os.path.join(path, name)
+
+        if os.path.isfile(shard):
+
+            total += os.path.getsize(shard)
+
+    return total
+
+
+def _key(entry):
+
+    return entry.get("archive", entry.get("url"))
+
+
+class URLSet(object):
+
+    def __init__(self, hashes = None):
+
+        """
+
+        Compact set of finished URLs, stored as a sorted array of 64-bit
+        hashes (8 bytes per URL) instead of a set of strings.
+
+        It is saved next to an archive or dataset (see sidecar) along with
+        the size of that file, so that it is only trusted while the two
+        match. Otherwise, load() rebuilds it from the archive.
+
+        Arguments:
+
+            - hashes: sorted array("Q") of URL hashes (default = None)
+
+        Example:
+
+            >>> done = URLSet.load("dev.archive")
+            >>> todo = [url for url in urls if url not in done]
+            >>> done.add(url)
+            >>> done.save("dev.archive")
+
+        """
+
+        self.hashes = hashes if hashes is not None else array("Q")
+        self.added = set()
+
+
+    def __len__(self):
+
+        return len(self.hashes) + len(self.added)
+
+
+    def _has(self, h):
+
+        if h in self.added:
+
+            return True
+
+        i = bisect_left(self.hashes, h)
+
+        return i < len(self.hashes) and self.hashes[i] == h
+
+
+    def __contains__(self, url):
+
+        return self._has(fingerprint(url))
+
+
+    def add(self, url):
+
+        h = fingerprint(url)
+
+        if not self._has(h):
+
+            self.added.add(h)
+
+
+    def update(self, urls):
+
+        for url in urls:
+
+            self.add(url)
+
+
+    def missing(self, urls):
+
+        """
+
+        URLs that are not in the set, in order (faster than checking
+        them one at a time).
+
+        """
+
+        urls = list(urls)
+
+        hashes = np.fromiter((fingerprint(url) for url in urls),
+            dtype = np.uint64, count = len(urls))
+
+        known = np.frombuffer(self._merged(), dtype = np.uint64)
+
+        if not len(known):
+
+            return urls
+
+        i = np.minimum(np.searchsorted(known, hashes), len(known) - 1)
+        found = known[i] == hashes
+
+        return [url for url, f in zip(urls, found.tolist()) if not f]
+
+
+    def count_missing(self, other):
+
+        """
+
+        Number of URLs in this set that are not in another.
+
+        """
+
+        mine = np.frombuffer(self._merged(), dtype = np.uint64)
+        theirs = np.frombuffer(other._merged(), dtype = np.uint64)
+
+        return int(np.count_nonzero(~np.isin(mine, theirs,
+            assume_unique = True)))
+
+
+    def _merged(self):
+
+        # Merge new hashes into the sorted array.
+
+        if self.added:
+
+            self.hashes = array("Q", merge(self.hashes, sorted(self.added)))
+            self.added = set()
+
+        return self.hashes
+
+
+    def save(self, path):
+
+        """
+
+        Write the set next to an archive or dataset, recording its size.
+
+        """
+
+        hashes = self._merged()
+        size = _size(path) if os.path.exists(path) else 0
+
+        tmp = sidecar(path) + ".tmp"
+
+        with open(tmp, "wb") as f:
+
+            f.write(_header.pack(_magic, size, len(hashes)))
+            hashes.tofile(f)
+
+        os.replace(tmp, sidecar(path))
+
+
+    @classmethod
+    def read(cls, path):
+
+        """
+
+        Read the set saved next to an archive or dataset.
+
+        Returns:
+
+            URLSet, or None if it is missing, corrupt or out of date
+
+        """
+
+        try:
+
+            size = _size(path)
+
+            with open(sidecar(path), "rb") as f:
+
+                magic, saved, count = _header.unpack(f.read(_header.size))
+
+                if magic != _magic or saved != size:
+
+                    return None
+
+                hashes = array("Q")
+                hashes.fromfile(f, count)
+
+        except (OSError, EOFError, ValueError, KeyError, struct.error):
+
+            return None
+
+        return cls(hashes)
+
+
+    @classmethod
+    def load(cls, path):
+
+        """
+
+        Load the finished URLs of an archive or dataset, from its sidecar
+        if it is up to date, or else by reading the URLs of every entry
+        (and saving a new sidecar for next time).
+
+        """
+
+        if not os.path.exists(path):
+
+            return cls()
+
+        done = cls.read(path)
+
+        if done is not None:
+
+            return done
+
+        done = cls()
+
+        with jsonl.open(path) as f:
+
+            for entry in f.readlines(ignore_errors = True,
+                    fields = ["archive", "url"]):
+
+                url = _key(entry)
+
+                if url is not None:
+
+                    done.add(url)
+
+        try:
+
+            done.save(path)
+
+        except OSError:
+
+            pass
+
+        return done
@@ -1 +1 @@
-from .read import readiter
+from .read import readiter, readscores
@@ -2,13 +2,14 @@
 
 import json, bz2, click
 from newsroom import jsonl
-import pandas as pd
+
+from . import readscores
 
 ################################################################################
 
 scores_file = click.Path(
     exists       = True,
-    dir_okay     = False,
+    dir_okay     = True,
     readable     = True,
     resolve_path = True,
 )
@@ -52,13 +53,31 @@ submission_file = click.Path(
     help = "ROUGE score variant to use. [default = fscore]"
 )
 
+@click.option(
+    "--subset",
+    type = str,
+    multiple = True,
+    help = "Only use summaries in a bin, e.g. density=extractive. [repeatable]"
+)
+
+@click.option(
+    "--iostats",
+    is_flag = True,
+    help = "Print per-file I/O statistics on exit. [default = off]",
+)
+
 ################################################################################
 
-def main(scores, submission, rouge, variant):
+def main(scores, submission, rouge, variant, subset, iostats):
+
+    if iostats:
+
+        jsonl.profile()
 
-    df = pd.DataFrame(jsonl.gzread(scores))
+    column = f"rouge_{rouge.upper()}_{variant}"
+    df = readscores(scores, [column], subset)
 
-    rouge_score = df[f"rouge_{rouge}_{variant}"].mean()
+    rouge_score = df[column].mean()
     hack_score = (1 - rouge_score ** 2) ** (1/2) - 1 
     csv = f"Id,Predicted\n1,{hack_score}\n2,{rouge_score}"
 
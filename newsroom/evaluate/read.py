@@ -1,4 +1,7 @@
 import fcntl, time, os
+import pandas as pd
+
+from ..build import jsonl
 
 
 def readiter(output):
@@ -23,3 +26,43 @@ def readiter(output):
         else:
 
             time.sleep(0.001)
+
+
+def readscores(path, columns, subsets = ()):
+
+    """
+
+    Load only the given columns of a scores file into a DataFrame.
+
+    Parquet files (see newsroom-convert) are read column by column and
+    filtered as they are read. JSON lines files are decoded for just the
+    needed fields, which skips the reference and system summaries.
+
+    Arguments:
+
+        path (str) - path of the scores file (JSON lines or Parquet)
+        columns (list[str]) - score columns to load
+        subsets (list[str]) - keep rows in bins, e.g. ["density=mixed"]
+
+    """
+
+    filters = []
+
+    for subset in subsets:
+
+        measure, level = subset.split("=")
+        filters.append((measure.strip() + "_bin", "=", level.strip()))
+
+    columns = list(dict.fromkeys(columns + [f[0] for f in filters]))
+
+    if jsonl.is_parquet(path):
+
+        return jsonl.read_parquet(path, columns, filters or None)
+
+    df = pd.DataFrame(jsonl.gzread(path, fields = columns), columns = columns)
+
+    for column, _, value in filters:
+
+        df = df[df[column] == value]
+
+    return df
@@ -2,7 +2,7 @@
 
 from subprocess import Popen, PIPE, STDOUT
 from threading import Thread
-import bz2, json, click
+import bz2, json, click, os
 from newsroom import jsonl
 
 from . import readiter
@@ -26,7 +26,7 @@ def _writer(process, dataset_file, keys):
 
 articles_file = click.Path(
     exists       = True,
-    dir_okay     = False,
+    dir_okay     = True,
     readable     = True,
     resolve_path = True,
 )
@@ -70,9 +70,27 @@ summaries_file = click.Path(
     help = "List of dataset keys to pass to system. [default = text]"
 )
 
+@click.option(
+    "--format",
+    "compression",
+    type = click.Choice(list(jsonl.formats)),
+    default = "gzip",
+    help = "Compression of the summaries file. [default = gzip]"
+)
+
+@click.option(
+    "--iostats",
+    is_flag = True,
+    help = "Print per-file I/O statistics on exit. [default = off]",
+)
+
 ################################################################################
 
-def main(system, dataset, summaries, keys):
+def main(system, dataset, summaries, keys, compression, iostats):
+
+    if iostats:
+
+        jsonl.profile()
 
     print("Starting", system, "Docker image.")
 
@@ -90,7 +108,10 @@ def main(system, dataset, summaries, keys):
 
     )
 
-    dataset_file = jsonl.open(dataset, gzip = True)
+    # Keep a sidecar index of the dataset only where one can be written.
+
+    dataset_file = jsonl.open(dataset,
+        index = os.access(os.path.dirname(dataset), os.W_OK))
 
     # Check the size of the dataset.
     # As a sanity check and for the progress bar.
@@ -118,7 +139,8 @@ def main(system, dataset, summaries, keys):
 
     is_json = True
 
-    with jsonl.open(summaries, gzip = True) as summaries_file:
+    with jsonl.open(summaries, buffer = 2 ** 20, index = True,
+            **jsonl.formats[compression]) as summaries_file:
 
         summaries_file.delete()
 
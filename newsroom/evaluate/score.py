@@ -1,6 +1,7 @@
 ################################################################################
 
-import json, bz2, click
+import json, bz2, click, os
+from itertools import chain
 from newsroom import jsonl
 
 from tqdm import tqdm
@@ -15,7 +16,7 @@ from .compute_rouge import *
 
 articles_file = click.Path(
     exists       = True,
-    dir_okay     = False,
+    dir_okay     = True,
     readable     = True,
     resolve_path = True,
 )
@@ -29,7 +30,7 @@ summaries_file = click.Path(
 
 output_file = click.Path(
     exists       = False,
-    dir_okay     = False,
+    dir_okay     = True,
     writable     = True,
     resolve_path = True,
 )
@@ -86,15 +87,46 @@ output_file = click.Path(
     help = "Items processed between updates. [default = 20*CPUs]",
 )
 
+@click.option(
+    "--shards",
+    type = int,
+    default = None,
+    help = "Write new scores as a directory of shards. [default = off]",
+)
+
+@click.option(
+    "--format",
+    "compression",
+    type = click.Choice(list(jsonl.formats)),
+    default = "gzip",
+    help = "Compression of the scores file. [default = gzip]",
+)
+
+@click.option(
+    "--iostats",
+    is_flag = True,
+    help = "Print per-file I/O statistics on exit. [default = off]",
+)
+
 ################################################################################
 
-def main(dataset, summaries, scores, rouge, stemmed, workers, chunksize):
+def main(dataset, summaries, scores, rouge, stemmed, workers, chunksize, shards,
+        compression, iostats):
+
+    if iostats:
+
+        jsonl.profile()
 
     rouges = rouge.upper().split(",")
 
-    with jsonl.open(dataset, gzip = True) as a:
-        with jsonl.open(summaries, gzip = True) as s:
-            with jsonl.open(scores, gzip = True) as f:
+    # Keep a sidecar index of the summaries only where one can be written.
+
+    indexed = os.access(os.path.dirname(summaries), os.W_OK)
+
+    with jsonl.open(dataset) as a:
+        with jsonl.open(summaries, index = indexed) as s:
+            with jsonl.open(scores, buffer = 2 ** 20, index = True,
+                    shards = shards, **jsonl.formats[compression]) as f:
 
                 # If scores file exists, delete it.
                 # (So we write, rather than appending.)
@@ -114,7 +146,13 @@ def main(dataset, summaries, scores, rouge, stemmed, workers, chunksize):
                             f.append(results)
                             progress.update(len(results))
 
-                    for aline, sline in zip(a, s):
+                    # Decode the next batch of articles while workers are busy.
+
+                    articles = chain.from_iterable(a.readlines(
+                        batch_size = chunksize,
+                        workers = 1))
+
+                    for aline, sline in zip(articles, s):
 
                         chunk.append([aline, sline, rouges, stemmed])
 
@@ -126,7 +164,7 @@ def main(dataset, summaries, scores, rouge, stemmed, workers, chunksize):
                     process_chunk()
 
     aggregate = {}
-    with jsonl.open(scores, gzip = True) as f:
+    with jsonl.open(scores) as f:
 
         for entry in f:
             for k, v in entry.items():
@@ -2,13 +2,14 @@
 
 import json, bz2, click
 from newsroom import jsonl
-import pandas as pd
+
+from . import readscores
 
 ################################################################################
 
 scores_file = click.Path(
     exists       = True,
-    dir_okay     = False,
+    dir_okay     = True,
     readable     = True,
     resolve_path = True,
 )
@@ -45,15 +46,40 @@ scores_file = click.Path(
     help = "List of summary bins to aggregate across. [default = density,coverage,compression]"
 )
 
+@click.option(
+    "--subset",
+    type = str,
+    multiple = True,
+    help = "Only use summaries in a bin, e.g. density=extractive. [repeatable]"
+)
+
+@click.option(
+    "--iostats",
+    is_flag = True,
+    help = "Print per-file I/O statistics on exit. [default = off]",
+)
+
 ################################################################################
 
-def main(scores, rouge, variants, bins):
+def main(scores, rouge, variants, bins, subset, iostats):
+
+    if iostats:
+
+        jsonl.profile()
+
+    # Load only the score and bin columns used in the tables.
+
+    columns = [f"{b}_bin" for b in bins.split(",")] + [
+        f"rouge_{r.upper()}_{v}"
+        for r in rouge.split(",")
+        for v in variants.split(",")
+    ]
 
     bins     = [f"{b.title()} Bin" for b in bins.split(",")]
     rouge    = [f"ROUGE {r}" for r in rouge.split(",")]
     variants = [v.title().replace("Fscore", "F-Score") for v in variants.split(",")]
 
-    df = pd.DataFrame(jsonl.gzread(scores))
+    df = readscores(scores, columns, subset)
 
     df.columns = [
         column
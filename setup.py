@@ -37,6 +37,11 @@ setup(
         "ujson>=1.35",
     ],
 
+    extras_require = {
+        "async": ["aiohttp>=3.6"],
+        "columnar": ["pyarrow>=14.0"],
+    },
+
     entry_points = {
         "console_scripts": [
             "newsroom-scrape=newsroom.build.scrape:main",
@@ -45,6 +50,8 @@ setup(
             "newsroom-score=newsroom.evaluate.score:main",
             "newsroom-tables=newsroom.evaluate.tables:main",
             "newsroom-kaggle=newsroom.evaluate.kaggle:main",
+            "newsroom-convert=newsroom.build.convert:main",
+            "newsroom-merge=newsroom.build.merge:main",
         ]
     },
 
@@ -0,0 +1,144 @@
+import os
+
+import pytest
+
+from newsroom import jsonl
+from newsroom.build import index
+from newsroom.build.index import Index
+
+
+def entries(start, stop):
+
+    return [{"archive": "http://a.com/%d" % i, "text": "x" * (i % 7)}
+            for i in range(start, stop)]
+
+
+@pytest.fixture(params = ["gzip", "bzip", "xz", "none"])
+def path(request, tmp_path):
+
+    return str(tmp_path / ("data." + request.param)), request.param
+
+
+def write(path, fmt, items, **kwargs):
+
+    with jsonl.open(path, **jsonl.formats[fmt], **kwargs) as f:
+
+        f.append(items)
+
+
+def test_sidecar_counts_lines(path):
+
+    path, fmt = path
+    write(path, fmt, entries(0, 50), index = True)
+
+    assert os.path.exists(path + ".idx")
+
+    with jsonl.open(path, index = True) as f:
+
+        assert len(f) == 50
+        assert f[0] == entries(0, 1)[0]
+        assert f[-1] == entries(49, 50)[0]
+        assert f[10:20] == entries(10, 20)
+
+
+def test_buffered_appends_update_sidecar(path):
+
+    path, fmt = path
+    write(path, fmt, entries(0, 30), index = True, buffer = 256)
+    write(path, fmt, entries(30, 60), index = True, buffer = 256)
+
+    index = Index(path, None if fmt == "none" else fmt)
+
+    assert index.load()
+    assert index.count == 60
+
+    with jsonl.open(path, index = True) as f:
+
+        assert f[25:35] == entries(25, 35)
+
+
+def test_stale_sidecar_is_rebuilt(path):
+
+    path, fmt = path
+    write(path, fmt, entries(0, 20), index = True)
+
+    # Appending without the index leaves the sidecar out of date.
+
+    write(path, fmt, entries(20, 25))
+
+    assert not Index(path, None if fmt == "none" else fmt).load()
+
+    with jsonl.open(path, index = True) as f:
+
+        assert len(f) == 25
+        assert f[22] == entries(22, 23)[0]
+
+    assert Index(path, None if fmt == "none" else fmt).load()
+
+
+def test_corrupt_sidecar_is_rebuilt(path):
+
+    path, fmt = path
+    write(path, fmt, entries(0, 20), index = True)
+
+    with open(path + ".idx", "wb") as f:
+
+        f.write(b"not an index")
+
+    with jsonl.open(path, index = True) as f:
+
+        assert len(f) == 20
+        assert f[5:8] == entries(5, 8)
+
+
+def test_delete_resets_sidecar(path):
+
+    path, fmt = path
+    write(path, fmt, entries(0, 20), index = True)
+
+    with jsonl.open(path, index = True) as f:
+
+        f.write(entries(100, 103))
+
+    with jsonl.open(path, index = True) as f:
+
+        assert len(f) == 3
+        assert f[:] == entries(100, 103)
+
+
+def test_index_out_of_range(path):
+
+    path, fmt = path
+    write(path, fmt, entries(0, 3), index = True)
+
+    with jsonl.open(path, index = True) as f:
+
+        with pytest.raises(IndexError):
+
+            f[3]
+
+
+def test_unwritable_sidecar(path, monkeypatch):
+
+    path, fmt = path
+    write(path, fmt, entries(0, 20))
+
+    # As in a read-only directory (which root could still write to).
+
+    def refuse(file, *args, **kwargs):
+
+        if str(file).endswith(".tmp"):
+
+            raise PermissionError(13, "Permission denied", file)
+
+        return open(file, *args, **kwargs)
+
+    monkeypatch.setattr(index, "_open", refuse)
+
+    with jsonl.open(path, index = True) as f:
+
+        assert len(f) == 20
+        assert f[7] == entries(7, 8)[0]
+
+    assert not os.path.exists(path + ".idx")
+    assert not os.path.exists(path + ".idx.tmp")
@@ -0,0 +1,66 @@
+import os
+
+from newsroom import jsonl
+from newsroom.build import index
+
+
+def entries(n):
+
+    return [{"archive": "http://a.com/%d" % i, "i": i} for i in range(n)]
+
+
+def write(path, n):
+
+    with jsonl.open(path) as f:
+
+        f.write(entries(n))
+
+
+def test_access(tmp_path):
+
+    path = str(tmp_path / "data.jsonl")
+    write(path, 100)
+
+    with jsonl.mapped(path) as f:
+
+        assert len(f) == 100
+        assert f[0] == entries(1)[0]
+        assert f[-1]["i"] == 99
+        assert f[10:13] == entries(13)[10:]
+        assert [e["i"] for e in f[[5, 2, 7]]] == [5, 2, 7]
+        assert len(f.sample(10, seed = 0)) == 10
+
+    assert os.path.exists(path + ".idx")
+
+
+def test_unwritable_sidecar(tmp_path, monkeypatch):
+
+    path = str(tmp_path / "data.jsonl")
+    write(path, 50)
+
+    def refuse(file, *args, **kwargs):
+
+        if str(file).endswith(".tmp"):
+
+            raise PermissionError(13, "Permission denied", file)
+
+        return open(file, *args, **kwargs)
+
+    monkeypatch.setattr(index, "_open", refuse)
+
+    with jsonl.mapped(path) as f:
+
+        assert len(f) == 50
+        assert f[49]["i"] == 49
+
+    assert not os.path.exists(path + ".idx")
+
+
+def test_empty(tmp_path):
+
+    path = str(tmp_path / "empty.jsonl")
+    write(path, 0)
+
+    with jsonl.mapped(path) as f:
+
+        assert len(f) == 0
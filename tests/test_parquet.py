@@ -0,0 +1,154 @@
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from newsroom import jsonl
+from newsroom.evaluate import readscores
+
+
+def scores(n):
+
+    return [{
+        "summary": "a summary %d" % i,
+        "system": "textrank",
+        "rouge_1_f": i / n,
+        "compression": i,
+        "density_bin": ["extractive", "mixed", "abstractive"][i % 3],
+        "note": None,
+    } for i in range(n)]
+
+
+@pytest.fixture
+def scores_file(tmp_path):
+
+    path = str(tmp_path / "test.scores")
+
+    with jsonl.open(path, gzip = True) as f:
+
+        f.write(scores(100))
+
+    return path
+
+
+def test_round_trip(scores_file, tmp_path):
+
+    parquet = str(tmp_path / "test.parquet")
+    back = str(tmp_path / "back.scores")
+
+    assert jsonl.to_parquet(scores_file, parquet, batch_size = 30) == 100
+    assert jsonl.is_parquet(parquet)
+    assert not jsonl.is_parquet(scores_file)
+
+    assert jsonl.from_parquet(parquet, back, gzip = True) == 100
+
+    with jsonl.open(back) as f:
+
+        read = f.read()
+
+    assert read == scores(100)
+    assert all(type(e["compression"]) is int for e in read)
+
+
+def test_from_parquet_overwrites(scores_file, tmp_path):
+
+    parquet = str(tmp_path / "test.parquet")
+    back = str(tmp_path / "back.scores")
+
+    jsonl.to_parquet(scores_file, parquet)
+    jsonl.from_parquet(parquet, back)
+    jsonl.from_parquet(parquet, back)
+
+    with jsonl.open(back) as f:
+
+        assert len(f.read()) == 100
+
+
+def test_sharded_round_trip(scores_file, tmp_path):
+
+    parquet = str(tmp_path / "test.parquet")
+    sharded = str(tmp_path / "sharded")
+
+    jsonl.to_parquet(scores_file, parquet)
+    jsonl.from_parquet(parquet, sharded, shards = 3, gzip = True)
+
+    with jsonl.open(sharded) as f:
+
+        read = f.read()
+
+    assert sorted(e["summary"] for e in read) == \
+        sorted(e["summary"] for e in scores(100))
+
+
+def test_schema_covers_every_batch(tmp_path):
+
+    path = str(tmp_path / "test.scores")
+    parquet = str(tmp_path / "test.parquet")
+    back = str(tmp_path / "back.scores")
+
+    # A key that first appears late, and a column that turns to floats.
+
+    written = scores(100)
+
+    for i, entry in enumerate(written[60:]):
+
+        entry["rouge_2_f"] = i / 40
+        entry["compression"] += 0.5
+
+    with jsonl.open(path) as f:
+
+        f.write(written)
+
+    jsonl.to_parquet(path, parquet, batch_size = 30)
+    jsonl.from_parquet(parquet, back)
+
+    with jsonl.open(back) as f:
+
+        read = f.read()
+
+    for entry in written[:60]:
+
+        entry["rouge_2_f"] = None
+
+    assert read == written
+
+
+def test_conflicting_types(tmp_path):
+
+    path = str(tmp_path / "test.scores")
+
+    with jsonl.open(path) as f:
+
+        f.write([{"a": 1}] * 10 + [{"a": "one"}] * 10)
+
+    with pytest.raises(TypeError):
+
+        jsonl.to_parquet(path, str(tmp_path / "test.parquet"), batch_size = 10)
+
+
+def test_empty_input(tmp_path):
+
+    path = str(tmp_path / "empty")
+    open(path, "w").close()
+
+    with pytest.raises(ValueError):
+
+        jsonl.to_parquet(path, str(tmp_path / "empty.parquet"))
+
+
+def test_readscores_same_for_both_formats(scores_file, tmp_path):
+
+    parquet = str(tmp_path / "test.parquet")
+    jsonl.to_parquet(scores_file, parquet)
+
+    columns = ["rouge_1_f"]
+    subsets = ["density = mixed"]
+
+    from_jsonl = readscores(scores_file, columns, subsets)
+    from_parquet = readscores(parquet, columns, subsets)
+
+    assert list(from_jsonl.columns) == ["rouge_1_f", "density_bin"]
+    assert list(from_parquet.columns) == ["rouge_1_f", "density_bin"]
+
+    assert len(from_jsonl) == len(from_parquet) == 33
+    assert from_jsonl["rouge_1_f"].tolist() == \
+        from_parquet["rouge_1_f"].tolist()
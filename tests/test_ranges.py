@@ -0,0 +1,174 @@
+import gzip, os, random
+
+import pytest
+
+from newsroom import jsonl
+
+
+def entries(start, stop):
+
+    # Poorly compressible values, so that files span several restart
+    # points of the index (which are about a megabyte apart).
+
+    return [{"archive": "http://a.com/%d" % i,
+             "html": random.Random(i).randbytes(1000).hex()}
+            for i in range(start, stop)]
+
+
+@pytest.fixture(params = ["gzip", "bzip", "xz", "none"])
+def fmt(request):
+
+    return request.param
+
+
+def read_ranges(ranges, **kwargs):
+
+    return [entry for item in ranges
+            for entry in jsonl.readrange(*item, **kwargs)]
+
+
+def test_round_trip(tmp_path, fmt):
+
+    path = str(tmp_path / "data")
+    written = entries(0, 3000)
+
+    with jsonl.open(path, index = True, buffer = 2 ** 16,
+            **jsonl.formats[fmt]) as f:
+
+        f.append(written)
+
+    with jsonl.open(path) as f:
+
+        ranges = f.ranges(size = 2 ** 18)
+
+    assert len(ranges) > 1
+    assert ranges[0][1] == 0
+    assert sum(length for _, _, length in ranges) == os.path.getsize(path)
+
+    assert read_ranges(ranges) == written
+
+
+def test_fields(tmp_path):
+
+    path = str(tmp_path / "data.gz")
+
+    with jsonl.open(path, gzip = True, index = True) as f:
+
+        f.append(entries(0, 50))
+
+    with jsonl.open(path) as f:
+
+        ranges = f.ranges()
+
+    assert read_ranges(ranges, fields = ["archive"]) == \
+        [{"archive": e["archive"]} for e in entries(0, 50)]
+
+
+def test_single_stream_is_one_range(tmp_path):
+
+    path = str(tmp_path / "data.gz")
+
+    with jsonl.open(path, gzip = True) as f:
+
+        f.write(entries(0, 10))
+
+    with open(path, "rb") as f:
+
+        stream = f.read()
+
+    # Rewrite as one gzip member, as an external tool would.
+
+    with gzip.open(path, "wb") as f:
+
+        f.write(gzip.decompress(stream))
+
+    with jsonl.open(path) as f:
+
+        ranges = f.ranges(size = 1)
+
+    assert len(ranges) == 1
+    assert read_ranges(ranges) == entries(0, 10)
+
+
+def test_build(tmp_path):
+
+    path = str(tmp_path / "data.gz")
+
+    with jsonl.open(path, gzip = True) as f:
+
+        f.append(entries(0, 20))
+
+    # Without an index, ranges are only found if it may be built.
+
+    with jsonl.open(path) as f:
+
+        assert f.ranges(build = False) is None
+
+    with jsonl.open(path, index = True) as f:
+
+        assert read_ranges(f.ranges()) == entries(0, 20)
+
+    with jsonl.open(path) as f:
+
+        assert f.ranges(build = False) is not None
+
+
+def test_empty(tmp_path):
+
+    path = str(tmp_path / "empty.gz")
+
+    with jsonl.open(path, gzip = True) as f:
+
+        f.write([])
+
+    with jsonl.open(path) as f:
+
+        assert f.ranges(build = False) in ([], None)
+        assert read_ranges(f.ranges()) == []
+
+
+def test_sharded(tmp_path):
+
+    path = str(tmp_path / "sharded")
+    written = entries(0, 200)
+
+    with jsonl.open(path, shards = 3, gzip = True, index = True) as f:
+
+        f.append(written)
+
+    with jsonl.open(path) as f:
+
+        ranges = f.ranges(size = 2 ** 16, build = False)
+
+    assert ranges is not None
+    assert len({p for p, _, _ in ranges}) == 3
+
+    read = read_ranges(ranges)
+
+    assert sorted(e["archive"] for e in read) == \
+        sorted(e["archive"] for e in written)
+
+    os.remove(os.path.join(path, "00001.jsonl.gz.idx"))
+
+    with jsonl.open(path) as f:
+
+        assert f.ranges(build = False) is None
+
+
+def test_ignore_errors(tmp_path):
+
+    path = str(tmp_path / "data")
+
+    with open(path, "w") as f:
+
+        f.write('{"a": 1}\nnot json\n{"a": 2}\n')
+
+    with jsonl.open(path) as f:
+
+        ranges = f.ranges()
+
+    with pytest.raises(ValueError):
+
+        read_ranges(ranges)
+
+    assert read_ranges(ranges, ignore_errors = True) == [{"a": 1}, {"a": 2}]
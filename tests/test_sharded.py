@@ -0,0 +1,188 @@
+import json, os, queue, threading, time
+
+import pytest
+
+from newsroom import jsonl
+
+
+def entries(n):
+
+    return [{"archive": "http://a.com/%d" % i, "i": i} for i in range(n)]
+
+
+@pytest.fixture
+def dataset(tmp_path):
+
+    path = str(tmp_path / "dataset")
+
+    with jsonl.open(path, shards = 4, gzip = True) as f:
+
+        f.append(entries(200))
+
+    return path
+
+
+def test_manifest_and_partitioning(dataset):
+
+    with open(os.path.join(dataset, "manifest.json")) as f:
+
+        manifest = json.load(f)
+
+    assert manifest["compression"] == "gzip"
+    assert len(manifest["shards"]) == 4
+
+    for i, name in enumerate(manifest["shards"]):
+
+        with jsonl.open(os.path.join(dataset, name)) as f:
+
+            for entry in f.readlines():
+
+                assert jsonl.shard(entry["archive"], 4) == i
+
+
+def test_read_in_shard_order(dataset):
+
+    with jsonl.open(dataset) as f:
+
+        read = f.read()
+
+    assert len(read) == 200
+    assert sorted(e["i"] for e in read) == list(range(200))
+
+
+def test_wrong_shard_count(dataset):
+
+    with pytest.raises(ValueError):
+
+        jsonl.open(dataset, shards = 3)
+
+
+def test_write_overwrites(dataset):
+
+    with jsonl.open(dataset) as f:
+
+        f.write(entries(5))
+
+    with jsonl.open(dataset) as f:
+
+        assert sorted(e["i"] for e in f.read()) == list(range(5))
+
+
+def test_getitem_matches_read(dataset):
+
+    with jsonl.open(dataset) as f:
+
+        read = f.read()
+
+        assert len(f) == 200
+        assert f[0] == read[0]
+        assert f[-1] == read[-1]
+        assert f[123] == read[123]
+
+        for key in [slice(None), slice(10, 150), slice(-30, None),
+                    slice(3, 190, 7), slice(None, None, -1),
+                    slice(180, 20, -3), slice(50, 50)]:
+
+            assert f[key] == read[key]
+
+        with pytest.raises(IndexError):
+
+            f[200]
+
+
+def test_slice_reads_each_shard_once(dataset, monkeypatch):
+
+    calls = []
+    getitem = jsonl.open.__getitem__
+
+    def counted(self, key):
+
+        calls.append(key)
+        return getitem(self, key)
+
+    monkeypatch.setattr(jsonl.open, "__getitem__", counted)
+
+    with jsonl.open(dataset) as f:
+
+        assert len(f[:]) == 200
+
+    assert len(calls) == 4
+
+
+@pytest.mark.parametrize("parallel", [2, 3, 8])
+@pytest.mark.parametrize("batch_size", [None, 16])
+def test_parallel_readlines(dataset, parallel, batch_size):
+
+    with jsonl.open(dataset) as f:
+
+        read = list(f.readlines(parallel = parallel, batch_size = batch_size))
+
+    if batch_size:
+
+        assert all(len(batch) <= batch_size for batch in read)
+        read = [entry for batch in read for entry in batch]
+
+    assert sorted(e["i"] for e in read) == list(range(200))
+
+
+def test_parallel_readlines_slow_queue(dataset, monkeypatch):
+
+    # More readers than shards, all racing for the last ones, must all
+    # finish (without the fix, the extra readers wait forever).
+
+    def slowed(method):
+
+        def slow(self, *args, **kwargs):
+
+            time.sleep(0.05)
+            return method(self, *args, **kwargs)
+
+        return slow
+
+    for name in ["get", "get_nowait"]:
+
+        monkeypatch.setattr(queue.Queue, name, slowed(getattr(queue.Queue, name)))
+
+    read = []
+
+    with jsonl.open(dataset) as f:
+
+        reader = threading.Thread(
+            target = lambda: read.extend(f.readlines(parallel = 8)),
+            daemon = True)
+
+        reader.start()
+        reader.join(30)
+
+    assert not reader.is_alive()
+    assert len(read) == 200
+
+
+def test_parallel_readlines_closed_early(dataset):
+
+    # Stopping after one entry must not leave readers blocked on the queue.
+
+    before = threading.active_count()
+
+    with jsonl.open(dataset) as f:
+
+        lines = f.readlines(parallel = 4, batch_size = 1)
+        next(lines)
+        lines.close()
+
+    assert threading.active_count() == before
+
+
+def test_parallel_readlines_consumer_error(dataset):
+
+    before = threading.active_count()
+
+    with pytest.raises(RuntimeError):
+
+        with jsonl.open(dataset) as f:
+
+            for entry in f.readlines(parallel = 4, batch_size = 1):
+
+                raise RuntimeError
+
+    assert threading.active_count() == before
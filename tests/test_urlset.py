@@ -0,0 +1,124 @@
+import os
+
+from newsroom import jsonl
+from newsroom.build.urlset import URLSet, sidecar
+
+
+def urls(start, stop):
+
+    return ["http://a.com/%d" % i for i in range(start, stop)]
+
+
+def archive(path, items, **kwargs):
+
+    with jsonl.open(path, gzip = True, **kwargs) as f:
+
+        f.append({"archive": url, "html": "<p>%s</p>" % url} for url in items)
+
+
+def test_membership_and_missing():
+
+    done = URLSet()
+    done.update(urls(0, 50))
+
+    assert len(done) == 50
+    assert "http://a.com/3" in done
+    assert "http://a.com/50" not in done
+
+    # Order is kept, and added hashes count once they are merged.
+
+    assert done.missing(urls(40, 60)) == urls(50, 60)
+
+    done.add("http://a.com/55")
+
+    assert done.missing(urls(40, 60)) == urls(50, 55) + urls(56, 60)
+
+
+def test_count_missing():
+
+    done = URLSet()
+    done.update(urls(0, 30))
+
+    downloaded = URLSet()
+    downloaded.update(urls(20, 50))
+
+    assert downloaded.count_missing(done) == 20
+    assert downloaded.count_missing(URLSet()) == 30
+
+
+def test_load_builds_and_saves(tmp_path):
+
+    path = str(tmp_path / "test.archive")
+    archive(path, urls(0, 40))
+
+    assert not os.path.exists(sidecar(path))
+
+    done = URLSet.load(path)
+
+    assert os.path.exists(sidecar(path))
+    assert done.missing(urls(30, 50)) == urls(40, 50)
+
+    saved = URLSet.read(path)
+
+    assert saved is not None
+    assert list(saved.hashes) == list(done.hashes)
+
+
+def test_appending_invalidates(tmp_path):
+
+    path = str(tmp_path / "test.archive")
+    archive(path, urls(0, 10))
+    URLSet.load(path)
+
+    archive(path, urls(10, 20))
+
+    assert URLSet.read(path) is None
+    assert URLSet.load(path).missing(urls(0, 25)) == urls(20, 25)
+
+
+def test_corrupt_sidecar(tmp_path):
+
+    path = str(tmp_path / "test.archive")
+    archive(path, urls(0, 10))
+
+    with open(sidecar(path), "wb") as f:
+
+        f.write(b"NRURLS01 truncated")
+
+    assert URLSet.read(path) is None
+    assert len(URLSet.load(path)) == 10
+
+
+def test_missing_archive(tmp_path):
+
+    path = str(tmp_path / "missing.archive")
+
+    assert len(URLSet.load(path)) == 0
+    assert not os.path.exists(sidecar(path))
+
+
+def test_sharded_ignores_indexes(tmp_path):
+
+    path = str(tmp_path / "sharded.archive")
+    archive(path, urls(0, 60), shards = 3, index = True)
+    URLSet.load(path)
+
+    # Rebuilding shard indexes does not change the data.
+
+    for name in os.listdir(path):
+
+        if name.endswith(".idx"):
+
+            os.remove(os.path.join(path, name))
+
+    with jsonl.open(path, index = True) as f:
+
+        assert len(f) == 60
+
+    assert URLSet.read(path) is not None
+
+    # But new entries do.
+
+    archive(path, urls(60, 61), index = True)
+
+    assert URLSet.read(path) is None